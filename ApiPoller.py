@@ -1,27 +1,30 @@
 import json
 import os
-import requests
 import time
 import logging
+from logging.handlers import QueueHandler, QueueListener
+import queue
+import atexit
+import signal
+import sys
 from datetime import datetime
 from pathlib import Path
-from PIL import Image
 import subprocess
+import shutil
 import threading
-from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 from gpiozero import AngularServo, Button, PWMLED # type: ignore
-from huawei_lte_api.Connection import Connection  # type: ignore
-from huawei_lte_api.Client import Client  # type: ignore
-from huawei_lte_api.enums.client import ResponseEnum  # type: ignore
 import cups
 import traceback
 import enum
-import math
+import struct
+import re
+import hashlib
+import random
 import glob as glob_module
 from dataclasses import dataclass
-from classes.huawei_modem_reader import HuaweiModemReader
-from classes.network_client import NetworkClient
-from classes.recovery_manager import RecoveryManager
+from types import SimpleNamespace
+from classes.network_client import NetworkClient, HTTPStatusError, CircuitBreakerOpenException
+from classes.recovery_manager import RecoveryManager, power_action, LINUX_REBOOT_CMD_RESTART, LINUX_REBOOT_CMD_POWER_OFF
 
 CONFIG_FILE = "config.json"
 STATUS_FILE = "printer_status.json"
@@ -29,11 +32,16 @@ LOG_FILE = "app.log"
 PENDING_COLLECTIONS_FILE = "pending_collections.json"
 
 # Threading locks for global variable access
-state_lock = threading.Lock()
+state_lock = threading.RLock()  # Re-entrant so set_state() can be called with it held
 flag_lock = threading.Lock()
 pending_ids_lock = threading.Lock()
+servo_lock = threading.Lock()
 button_press_event = threading.Event()
 
+# Latest modem signal data, refreshed by a background thread so requests never wait on the modem
+signal_lock = threading.Lock()
+signal_cache = {"data": None, "ts": 0, "stale_warned": False}
+
 # Default configuration values
 DEFAULT_CONFIG = {
     "printer_token": "<TOKEN>",
@@ -50,17 +58,20 @@ DEFAULT_CONFIG = {
     "auth_check_url": "/auth/check",
     "collection_url": "/message/collected",
     "modem_gateway_url": "http://192.168.8.1",
+    "signal_refresh_interval": 15,  # Seconds between background modem signal reads
     "print_command": "/snap/bin/cups.lp",
     "printer_name": "Canon_SELPHY_CP1500",
     "initial_delay": 10,
     "cups_retries": 30,
     "check_interval": 30,
+    "long_poll_wait": 0,  # Seconds the server may hold a message request open (0 = plain polling)
     "command_check_interval": 10,
     "request_timeout_interval": 30,
     "reboot_modem": False,
     "modem_restart_trigger_interval": 3600,
     "modem_restart_notify_timeout_interval": 300,
-    "modem_boot_time": 60,
+    "modem_boot_time": 60,  # Upper bound; the wait ends early once the modem reports a connection
+    "modem_boot_min_time": 20,  # Before this the modem hasn't even gone down yet
     "image_path": "images/",
     "paper_capacity": 18,
     "ink_capacity": 54,
@@ -76,6 +87,8 @@ DEFAULT_CONFIG = {
     },
     "paper_led": False,
     "servo_pin": 14,
+    "servo_degrees_per_second": 300,  # Conservative travel speed of the flag servo under load
+    "servo_detach_delay": 2,  # Seconds the servo stays attached after a move, so back-to-back moves skip re-attaching
     "button_pin": 24,
     "flag_down_angle": 180,
     "flag_up_angle": 0,
@@ -86,12 +99,18 @@ DEFAULT_CONFIG = {
     "retry_critical_attempts": 10,
     "retry_backoff_factor": 2.0,
     "retry_max_delay": 60,
-    "connection_pool_size": 10,
+    "retry_base_delay": 1.0,
+    "retry_jitter_mode": "full",  # Spread retries after a modem restart so they don't line up
+    "retry_jitter": 0.3,  # Only used by "proportional" mode: up to 30% random extra delay
+    "connection_pool_size": 2,
     "connect_timeout": 10,
     "read_timeout": 30,
-    "keepalive_timeout": 60,
+    "keepalive_timeout": 75,  # Matches nginx's default keepalive_timeout
     "circuit_breaker_threshold": 5,
     "circuit_breaker_cooldown": 60,
+    "circuit_breaker_cooldown_factor": 2.0,  # Cooldown grows 60s, 120s, 240s... while the server stays down
+    "circuit_breaker_cooldown_max": 900,
+    "circuit_breaker_success_threshold": 2,
     "max_consecutive_errors": 30,
     "verbose_logging": False,
     "no_print": False,
@@ -101,9 +120,19 @@ DEFAULT_CONFIG = {
 class ConfigManager:
     """Manages configuration with default value fallback."""
 
+    # Endpoints whose full URL is joined once per config update instead of on every request
+    ENDPOINTS = ("request", "ack", "image", "collection", "command", "command_ack", "config", "auth_check")
+
     def __init__(self, defaults):
         self.defaults = defaults
-        self.config = {}
+        # Always a full merge of defaults and overrides, so lookups need one probe
+        self.config = dict(defaults)
+        self.endpoints = self._build_endpoints()
+
+    def _build_endpoints(self):
+        """Join the base URL with each endpoint path, e.g. endpoints.request."""
+        base = self.config["url"]
+        return SimpleNamespace(**{name: base + self.config[f"{name}_url"] for name in self.ENDPOINTS})
 
     def update_from_dict(self, config_dict):
         """Update config from a dictionary, merging with defaults."""
@@ -118,18 +147,19 @@ class ConfigManager:
                 merged[key] = value
 
         self.config = merged
+        self.endpoints = self._build_endpoints()
 
     def __getitem__(self, key):
         """Dict-like access: config["key"]"""
-        return self.config.get(key, self.defaults.get(key))
+        return self.config.get(key)
 
     def get(self, key, default=None):
         """Safe access with optional default."""
-        return self.config.get(key, self.defaults.get(key, default))
+        return self.config.get(key, default)
 
     def __contains__(self, key):
         """Support 'in' operator."""
-        return key in self.config or key in self.defaults
+        return key in self.config
     
 
 @dataclass
@@ -144,28 +174,41 @@ last_successful_request = time.time()
 last_successful_command_request = time.time()
 
 servo = None
+servo_angle = None  # Last commanded angle, None until init_servo() has positioned it
+servo_detach_timer = None
 button = None
 flag_raised = False
 config = ConfigManager(DEFAULT_CONFIG)
+config_hash = None  # Digest of the bytes config.json was last loaded from or written with
 pending_message_ids = []
+saved_pending_message_ids = []  # What's currently on disk, to skip redundant writes
 
 def load_pending_collections():
     """Load pending message IDs from persistent storage."""
-    global pending_message_ids
-    if os.path.exists(PENDING_COLLECTIONS_FILE):
-        try:
-            with open(PENDING_COLLECTIONS_FILE, 'r') as f:
-                pending_message_ids = json.load(f)
-                log_event(f"Loaded {len(pending_message_ids)} pending collection ID(s) from disk.")
-        except Exception as e:
-            log_error(f"Failed to load pending collections: {e}")
-            pending_message_ids = []
+    global pending_message_ids, saved_pending_message_ids
+    try:
+        with open(PENDING_COLLECTIONS_FILE, 'r') as f:
+            pending_message_ids = json.load(f)
+            saved_pending_message_ids = list(pending_message_ids)
+            log_event(f"Loaded {len(pending_message_ids)} pending collection ID(s) from disk.")
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        log_error(f"Failed to load pending collections: {e}")
+        pending_message_ids = []
 
 def save_pending_collections():
-    """Save pending message IDs to persistent storage."""
+    """Save pending message IDs to persistent storage if they changed."""
+    global saved_pending_message_ids
+    if pending_message_ids == saved_pending_message_ids:
+        return
     try:
-        with open(PENDING_COLLECTIONS_FILE, 'w') as f:
+        # Write to a temp file and rename, so a power cut can't leave a torn file
+        tmp_file = PENDING_COLLECTIONS_FILE + ".tmp"
+        with open(tmp_file, 'w') as f:
             json.dump(pending_message_ids, f)
+        os.replace(tmp_file, PENDING_COLLECTIONS_FILE)
+        saved_pending_message_ids = list(pending_message_ids)
     except Exception as e:
         log_error(f"Failed to save pending collections: {e}")
 
@@ -173,6 +216,7 @@ def save_pending_collections():
 led_red = None
 led_green = None
 led_blue = None
+led_color = None  # Color currently shown, to skip redundant PWM writes
 paper_led_red = None
 paper_led_green = None
 paper_led_blue = None
@@ -187,6 +231,12 @@ cupsConn = None
 network_client = None
 recovery_manager = None
 
+# Downloaded messages waiting for the print worker, as (message_id, image_path, headers).
+# Only the print worker uses cupsConn once the main loop is running.
+print_queue = queue.Queue()
+# Messages queued or being printed and acknowledged, guarded by state_lock
+prints_in_flight = 0
+
 # State enum
 class State(enum.Enum):
     BOOTING = "Booting"
@@ -205,6 +255,25 @@ class State(enum.Enum):
     MODEM_REBOOTING = "Modem rebooting"
     PRINTER_UNREACHABLE = "Printer unreachable"
 
+# Status LED color (red, green, blue) for each state; unknown states turn the LED off
+STATE_COLOR = {
+    State.IDLE: (0, 1, 0),  # Green
+    State.INCOMING_TRANSMISSION: (0, 0, 1),  # Blue
+    State.MESSAGE_RECEIVED: (0, 1, 1),  # Cyan
+    State.ACKNOWLEDGING: (1, 1, 1),  # White
+    State.OUT_OF_INK: (1, 0, 0),  # Red
+    State.OUT_OF_PAPER: (1, 0, 0),  # Red
+    State.OUT_OF_INK_AND_PAPER: (1, 0, 0),  # Red
+    State.PAPER_JAM: (1, 0, 0),  # Red
+    State.WAITING_FOR_CUPS: (1, 0, 1),  # Magenta
+    State.CONNECTION_WEAK: (1, 0.3, 0),  # Orange (network issues, retrying)
+    State.NO_CONNECTION: (1, 0, 0),  # Red (connection lost)
+    State.CIRCUIT_BREAKER_OPEN: (0.2, 0.8, 1),  # Light blue (server down, circuit breaker open)
+    State.MODEM_REBOOTING: (0.8, 0, 1),  # Purple (modem rebooting)
+    State.PRINTER_UNREACHABLE: (1, 0, 0),  # Red
+    State.BOOTING: (1, 1, 0),  # Yellow (initializing)
+}
+
 state = State.BOOTING
 state_before_connection_issue = None
 no_connection_since = None  # Timestamp when NO_CONNECTION state was entered
@@ -213,44 +282,93 @@ last_modem_reboot_attempt = None  # Timestamp of last modem reboot attempt
 # Speed of last download
 last_download_speed = None
 
-# Setup logging
-logging.basicConfig(filename=LOG_FILE, level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s')
-
+# Setup logging - callers only enqueue records, a listener thread does the file writes
+log_queue = queue.SimpleQueue()
+log_file_handler = logging.FileHandler(LOG_FILE)
+log_file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+log_listener = QueueListener(log_queue, log_file_handler)
+logging.basicConfig(level=logging.INFO, handlers=[QueueHandler(log_queue)])
+log_listener.start()
+atexit.register(log_listener.stop)  # Flush queued records on exit
+
+# Console timestamp prefix, formatted at most once per second
+timestamp_second = None
+timestamp_prefix = ""
+
+def _timestamp():
+    global timestamp_second, timestamp_prefix
+    now = int(time.time())
+    if now != timestamp_second:
+        timestamp_prefix = time.strftime("[%Y-%m-%d %H:%M:%S]", time.localtime(now))
+        timestamp_second = now
+    return timestamp_prefix
+
+# The log file gets its timestamp from the formatter's %(asctime)s
 def log_event(message):
-    timestamp = "[" + datetime.now().strftime("%Y-%m-%d %H:%M:%S") + "]"
-    print(f"{timestamp} - {message}")
-    logging.info(f"{timestamp} - {message}")
+    print(f"{_timestamp()} - {message}")
+    logging.info(message)
+
+def log_warning(message):
+    print(f"{_timestamp()} - {message}")
+    logging.warning(message)
 
 def log_error(message):
-    timestamp = "[" + datetime.now().strftime("%Y-%m-%d %H:%M:%S") + "]"
-    print(f"{timestamp} - {message}")
-    logging.error(f"{timestamp} - {message}")
+    print(f"{_timestamp()} - {message}")
+    logging.error(message)
 
 def log_verbose(message):
     """Log verbose debug messages only if verbose_logging is enabled"""
     if config.get("verbose_logging", False):
-        timestamp = "[" + datetime.now().strftime("%Y-%m-%d %H:%M:%S") + "]"
-        print(f"{timestamp} - [VERBOSE] {message}")
-        logging.info(f"{timestamp} - [VERBOSE] {message}")
+        print(f"{_timestamp()} - [VERBOSE] {message}")
+        logging.info(f"[VERBOSE] {message}")
 
-def on_network_connection_weak():
-    """Callback when network connection has first failure."""
-    global state, state_before_connection_issue
+def _sleep_backoff(attempt, cap=60):
+    """Sleep 2**attempt seconds plus up to 1s of jitter, capped at cap seconds"""
+    # Callers keep counting while an outage lasts; past 2**1023 the float addition
+    # overflows, and 2**16 is already beyond any cap
+    time.sleep(min(cap, 2 ** min(attempt, 16) + random.uniform(0, 1)))
+
+def log_console(message):
+    """Print a routine polling message to the console only, keeping it out of the log file"""
+    print(f"{_timestamp()} {message}")
+
+def set_state(new_state):
+    """Set the global state and repaint the status LED if it changed."""
+    global state
+    with state_lock:
+        if new_state == state:
+            return
+        log_verbose(f"State: {state.value} -> {new_state.value}")
+        state = new_state
+        update_led_status(new_state)
+
+# States entered because of network trouble; leaving them restores the state saved on entry
+CONNECTION_ISSUE_STATES = frozenset({State.CONNECTION_WEAK, State.NO_CONNECTION, State.CIRCUIT_BREAKER_OPEN})
+
+def enter_connection_issue(issue_state):
+    """Switch to a connection issue state, remembering the state to return to."""
+    global state_before_connection_issue
     with state_lock:
         # Only save previous state if we're not already in a connection issue state
-        if state not in [State.CONNECTION_WEAK, State.NO_CONNECTION, State.CIRCUIT_BREAKER_OPEN]:
+        if state not in CONNECTION_ISSUE_STATES:
             state_before_connection_issue = state
-        state = State.CONNECTION_WEAK
+        set_state(issue_state)
+
+def leave_connection_issue(issue_states):
+    """If in one of issue_states, restore the state saved on entry (IDLE if none was saved)."""
+    global state_before_connection_issue
+    with state_lock:
+        if state in issue_states:
+            set_state(state_before_connection_issue or State.IDLE)
+            state_before_connection_issue = None
+
+def on_network_connection_weak():
+    """Callback when network connection has first failure."""
+    enter_connection_issue(State.CONNECTION_WEAK)
 
 def on_network_connection_lost():
     """Callback when network connection is completely lost (all retries exhausted)."""
-    global state, state_before_connection_issue
-    with state_lock:
-        # Only save previous state if we're not already in a connection issue state
-        if state not in [State.CONNECTION_WEAK, State.NO_CONNECTION, State.CIRCUIT_BREAKER_OPEN]:
-            state_before_connection_issue = state
-        state = State.NO_CONNECTION
+    enter_connection_issue(State.NO_CONNECTION)
 
     log_event("Connection lost - triggering recovery manager")
 
@@ -258,7 +376,7 @@ def on_network_connection_lost():
         """Check if network connection is restored"""
         try:
             response = network_client.get(
-                config["url"] + config["request_url"],
+                config.endpoints.request,
                 headers=getInitialHeaders(),
                 max_attempts=1
             )
@@ -280,39 +398,16 @@ def on_network_connection_lost():
 
 def on_network_connection_restored():
     """Callback when network connection is restored."""
-    global state, state_before_connection_issue
-    with state_lock:
-        log_event("Connection restored")
-        # Restore to previous state if we were in a connection issue state
-        if state in [State.CONNECTION_WEAK, State.NO_CONNECTION, State.CIRCUIT_BREAKER_OPEN]:
-            if state_before_connection_issue is not None:
-                state = state_before_connection_issue
-                state_before_connection_issue = None
-            else:
-                # Fallback to IDLE if we don't have a previous state
-                state = State.IDLE
+    log_event("Connection restored")
+    leave_connection_issue(CONNECTION_ISSUE_STATES)
 
 def on_circuit_breaker_open():
     """Callback when circuit breaker opens (server confirmed down, internet is up)."""
-    global state, state_before_connection_issue
-    with state_lock:
-        # Only save previous state if we're not already in a connection issue state
-        if state not in [State.CONNECTION_WEAK, State.NO_CONNECTION, State.CIRCUIT_BREAKER_OPEN]:
-            state_before_connection_issue = state
-        state = State.CIRCUIT_BREAKER_OPEN
+    enter_connection_issue(State.CIRCUIT_BREAKER_OPEN)
 
 def on_circuit_breaker_close():
     """Callback when circuit breaker closes (server recovered)."""
-    global state, state_before_connection_issue
-    with state_lock:
-        # Restore to previous state if we're in circuit breaker open state
-        if state == State.CIRCUIT_BREAKER_OPEN:
-            if state_before_connection_issue is not None:
-                state = state_before_connection_issue
-                state_before_connection_issue = None
-            else:
-                # Fallback to IDLE if we don't have a previous state
-                state = State.IDLE
+    leave_connection_issue({State.CIRCUIT_BREAKER_OPEN})
 
 def init_network_client():
     """Initialize network client and recovery manager with configuration."""
@@ -327,8 +422,14 @@ def init_network_client():
         retry_max_attempts=config["retry_max_attempts"],
         retry_backoff_factor=config["retry_backoff_factor"],
         retry_max_delay=config["retry_max_delay"],
+        retry_base_delay=config["retry_base_delay"],
+        retry_jitter=config["retry_jitter"],
+        retry_jitter_mode=config["retry_jitter_mode"],
         circuit_breaker_threshold=config["circuit_breaker_threshold"],
         circuit_breaker_cooldown=config["circuit_breaker_cooldown"],
+        circuit_breaker_cooldown_factor=config["circuit_breaker_cooldown_factor"],
+        circuit_breaker_cooldown_max=config["circuit_breaker_cooldown_max"],
+        circuit_breaker_success_threshold=config["circuit_breaker_success_threshold"],
         on_connection_weak=on_network_connection_weak,
         on_connection_lost=on_network_connection_lost,
         on_connection_restored=on_network_connection_restored,
@@ -340,8 +441,43 @@ def init_network_client():
         modem_reboot_callback=reboot_modem
     )
 
+    signal_thread = threading.Thread(target=refresh_signal_data, daemon=True)
+    signal_thread.start()
+
     log_event("Network client initialized with keepalive and exponential backoff")
 
+def refresh_signal_data():
+    """Read modem signal data every signal_refresh_interval seconds into signal_cache."""
+    # Imported here so huawei_lte_api loads on this thread, off the startup path
+    try:
+        from classes.huawei_modem_reader import HuaweiModemReader
+    except Exception as e:
+        log_error(f"Modem reader unavailable, signal data disabled: {e}")
+        return
+    interval = config["signal_refresh_interval"]
+    # One session for the thread's lifetime instead of a fresh login per read
+    reader = None
+    while True:
+        if get_connection_type() != "wifi":
+            try:
+                if reader is None:
+                    reader = HuaweiModemReader(config["modem_gateway_url"], timeout=2).__enter__()
+                data = reader.get_signal_data()
+                with signal_lock:
+                    signal_cache["data"] = data
+                    signal_cache["ts"] = time.monotonic()
+                    signal_cache["stale_warned"] = False
+            except Exception as e:
+                log_error(f"Modem read error: {e}")
+                # Reconnect from scratch next cycle
+                if reader is not None:
+                    try:
+                        reader.__exit__(None, None, None)
+                    except Exception:
+                        pass
+                    reader = None
+        time.sleep(interval)
+
 def check_prolonged_no_connection():
     """Check if we've been in NO_CONNECTION state too long and trigger modem reboot."""
     global no_connection_since, last_modem_reboot_attempt
@@ -380,12 +516,15 @@ def check_prolonged_no_connection():
         reboot_modem()
 
 def reboot_modem():
-    global state, state_before_connection_issue
+    # Only needed on the rare reboot path, keep it out of the startup imports
+    from huawei_lte_api.Connection import Connection  # type: ignore
+    from huawei_lte_api.Client import Client  # type: ignore
+    from huawei_lte_api.enums.client import ResponseEnum  # type: ignore
 
     # Save current state before modem reboot
     with state_lock:
         state_before_modem_reboot = state
-        state = State.MODEM_REBOOTING
+        set_state(State.MODEM_REBOOTING)
 
     try:
         log_event("Rebooting modem...")
@@ -397,43 +536,79 @@ def reboot_modem():
 
                 # Wait for modem to fully boot up before resuming operations
                 modem_boot_time = config["modem_boot_time"]
-                log_event(f"Waiting {modem_boot_time}s for modem to boot...")
-                time.sleep(modem_boot_time)
-                log_event("Modem should be ready now")
+                log_event(f"Waiting up to {modem_boot_time}s for modem to boot...")
+                deadline = time.monotonic() + modem_boot_time
+                time.sleep(min(config["modem_boot_min_time"], modem_boot_time))
+                while True:
+                    if modem_connected():
+                        log_event("Modem is back online")
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        log_event("Modem should be ready now")
+                        break
+                    time.sleep(min(random.uniform(1, 3), remaining))
 
                 # Restore previous state
                 with state_lock:
-                    state = state_before_modem_reboot
+                    set_state(state_before_modem_reboot)
             else:
                 log_error("Modem reboot failed.")
                 with state_lock:
-                    state = state_before_modem_reboot
+                    set_state(state_before_modem_reboot)
     except Exception as e:
         log_error(f"Error rebooting modem: {e}")
         with state_lock:
-            state = state_before_modem_reboot
+            set_state(state_before_modem_reboot)
+
+def modem_connected():
+    """True once the modem answers and reports an established data connection."""
+    from huawei_lte_api.Connection import Connection  # type: ignore
+    from huawei_lte_api.Client import Client  # type: ignore
+
+    try:
+        with Connection(config["modem_gateway_url"], timeout=2) as connection:
+            return Client(connection).monitoring.status().get("ConnectionStatus") == "901"  # 901 = connected
+    except Exception:
+        return False
 
 def init_config():
     global config
 
-    if not os.path.exists(CONFIG_FILE):
+    try:
+        load_config_file()
+    except FileNotFoundError:
         log_event(f"Rename and edit one of the provided config files to config.json and edit token, then start program again.")
-        exit()
-    
-    load_config_file()
+        shutdown_gracefully(1)
 
     if config["printer_token"] == "<TOKEN>":
         log_error("Please enter a valid printer token in the config file and restart.")
-        exit()
+        shutdown_gracefully(1)
+
+def release_resources():
+    """Close network sessions and drop shared handles; runs once at interpreter exit."""
+    global cupsConn
+    if network_client is not None:
+        network_client.close()
+    if recovery_manager is not None:
+        recovery_manager.close()
+    cupsConn = None
+
+def shutdown_gracefully(code=0):
+    """Exit with the given code; resources are released by the atexit hook."""
+    log_event(f"Shutting down (exit code {code})")
+    sys.exit(code)
 
 def load_config_file():
-    global config
-    with open(CONFIG_FILE, 'r') as f:
-        config_dict = json.load(f)
+    global config, config_hash
+    with open(CONFIG_FILE, 'rb') as f:
+        raw = f.read()
+    config_dict = json.loads(raw)
     config.update_from_dict(config_dict)
+    config_hash = hashlib.blake2b(raw, digest_size=16).digest()
 
 def update_config():
-    global state
+    global config_hash
     log_event("Pulling config...")
     if state in [State.BOOTING, State.NO_CONNECTION]:
         headers = getInitialHeaders()
@@ -444,27 +619,36 @@ def update_config():
 
     try:
         response = network_client.get(
-            config["url"] + config["config_url"],
+            config.endpoints.config,
             headers=headers,
             max_attempts=5  # Use more attempts for config fetch
         )
         if response.status_code == 200 and 'application/json' in response.headers.get('Content-Type', ''):
             log_event("Config retrieved")
-            data = response.json()
-            if check_config(data):
-                with open(CONFIG_FILE, "w") as f:
-                    json.dump(data, f, indent=4)
+            raw = response.content
+            new_hash = hashlib.blake2b(raw, digest_size=16).digest()
+            if new_hash == config_hash:
+                # Same bytes as config.json, nothing to write or merge
+                log_event("Config unchanged")
+            elif check_config(data := json.loads(raw)):
+                # Store the server's bytes as-is rather than re-serialising the parsed dict
+                with open(CONFIG_FILE, "wb") as f:
+                    f.write(raw)
                 # Server config overrides all, then defaults fill in any missing fields
                 config.update_from_dict(data)
+                config_hash = new_hash
                 log_event("Config updated")
             else:
                 log_error("Pulled config doesn't pass integrity check, not using it.")
         else:
             log_error(f"Error: {response.status_code}")
-        state = State.BOOTING
+        set_state(State.BOOTING)
     except Exception as e:
         log_error(f"Failed to update config after retries: {e}")
-        state = State.NO_CONNECTION
+        set_state(State.NO_CONNECTION)
+
+# Printer tokens are exactly 32 ASCII letters/digits (str.isalnum() would also accept other Unicode)
+TOKEN_RE = re.compile(r"[A-Za-z0-9]{32}")
 
 def check_config(data):
     if not isinstance(data, dict):
@@ -474,10 +658,7 @@ def check_config(data):
     if not isinstance(token, str):
         return False
 
-    if len(token) != 32:
-        return False
-
-    return token.isalnum()
+    return TOKEN_RE.fullmatch(token) is not None
 
 def get_default_routes() -> list[Route]:
     """Get all default routes, sorted by preference (lowest metric first)."""
@@ -516,16 +697,19 @@ def get_connection_type():
         return "lte"
     return "unknown"
 
-def getInitialHeaders():
+def get_printer_status():
+    """Value for the X-Printer-Status header, derived from the current state."""
     with state_lock:
         if state in [State.OUT_OF_INK, State.OUT_OF_PAPER, State.OUT_OF_INK_AND_PAPER, State.PAPER_JAM, State.BOOTING, State.WAITING_FOR_CUPS, State.ACKNOWLEDGING, State.PRINTER_UNREACHABLE]:
             status = state.value
         else:
             status = "Normal"
+    return status
 
+def getInitialHeaders():
     headers = {
         "Authorization": config["printer_token"],
-        "X-Printer-Status": status
+        "X-Printer-Status": get_printer_status()
     }
 
     return headers
@@ -534,8 +718,9 @@ def getHeaders():
     """
     Get headers with modem signal data.
 
-    Attempts to read modem data once with timeout. Falls back to basic headers
-    if modem is unavailable.
+    Uses the signal data cached by refresh_signal_data(), so no modem request
+    is made here. Falls back to basic headers if no data has been read yet,
+    or if the last read is more than two refresh intervals old.
 
     Returns:
         dict: Headers dictionary with or without modem data
@@ -546,37 +731,28 @@ def getHeaders():
     if connection_type == "wifi":
         log_event("Using wifi, sending basic headers...")
         return getInitialHeaders()
-    
-    # Try to read modem data once with timeout (no retries)
-    data = None
-    timeout_seconds = 2
 
-    def _read_modem_data():
-        """Helper function to read modem data (for timeout wrapping)."""
-        with HuaweiModemReader(config["modem_gateway_url"], timeout=timeout_seconds) as reader:
-            return reader.get_signal_data()
-
-    try:
-        # Execute modem read with timeout using ThreadPoolExecutor
-        with ThreadPoolExecutor(max_workers=1) as executor:
-            future = executor.submit(_read_modem_data)
-            data = future.result(timeout=timeout_seconds)
-    except FuturesTimeoutError:
-        log_error("Modem read timeout - falling back to basic headers")
-    except Exception as e:
-        log_error(f"Modem read error: {e} - falling back to basic headers")
+    with signal_lock:
+        data = signal_cache["data"]
+        age = time.monotonic() - signal_cache["ts"]
+        stale = data is not None and age > 2 * config["signal_refresh_interval"]
+        # Warn once per stale stretch, not on every request
+        warn_stale = stale and not signal_cache["stale_warned"]
+        if warn_stale:
+            signal_cache["stale_warned"] = True
 
     # If modem data unavailable, fall back to basic headers
     if data is None:
         log_error("Modem unavailable - using basic headers without signal data")
         return getInitialHeaders()
 
+    if stale:
+        if warn_stale:
+            log_warning(f"Modem signal data is {age:.0f}s old - using basic headers until it refreshes")
+        return getInitialHeaders()
+
     # Got modem data successfully - build full headers
-    with state_lock:
-        if state in [State.OUT_OF_INK, State.OUT_OF_PAPER, State.OUT_OF_INK_AND_PAPER, State.PAPER_JAM, State.BOOTING, State.WAITING_FOR_CUPS, State.ACKNOWLEDGING, State.PRINTER_UNREACHABLE]:
-            status = state.value
-        else:
-            status = "Normal"
+    status = get_printer_status()
 
     headers = {
         "Authorization": config["printer_token"],
@@ -591,48 +767,80 @@ def getHeaders():
 
     return headers
 
-def check_for_new_messages():
-    global last_successful_request, state
-    print("[" + datetime.now().strftime("%Y-%m-%d %H:%M:%S") + "] Checking for new messages...")
+def check_for_new_messages(headers=None):
+    """
+    Poll the server for a new message and handle it.
+
+    Args:
+        headers: Headers to send, to share one getHeaders() call between checks
+
+    Returns:
+        bool: True if the server held the request open for the full long-poll
+              window, meaning the next check can be issued right away
+    """
+    global last_successful_request
+    # Don't fetch the next message until the last one is printed and acknowledged,
+    # otherwise the server would hand out the same message again
+    with state_lock:
+        busy = prints_in_flight > 0
+    if busy:
+        log_event("Previous message still printing or being acknowledged, skipping message check.")
+        return False
+
+    log_console("Checking for new messages...")
 
     # Cache headers once to avoid multiple modem reads on retries
-    cached_headers = getHeaders()
+    cached_headers = headers if headers is not None else getHeaders()
+
+    long_poll_wait = config["long_poll_wait"]
+    request_kwargs = {}
+    if long_poll_wait:
+        # Ask the server to hold the request until a message is ready
+        request_kwargs["params"] = {"wait": long_poll_wait}
+        request_kwargs["timeout"] = (config["connect_timeout"], long_poll_wait + 5)
 
     try:
+        start = time.monotonic()
         response = network_client.get(
-            config["url"] + config["request_url"],
+            config.endpoints.request,
             headers=cached_headers,
-            max_attempts=5  # More attempts for polling endpoint
+            max_attempts=5,  # More attempts for polling endpoint
+            **request_kwargs
         )
         if response.status_code == 200 and 'application/json' in response.headers.get('Content-Type', ''):
             log_event("New message found")
-            handle_message(config, response.json())
+            handle_message(config, response.json(), cached_headers)
         elif response.status_code == 201:
             # log_event("No new messages found")
-            print("[" + datetime.now().strftime("%Y-%m-%d %H:%M:%S") + "] No new messages found")
+            log_console("No new messages found")
         else:
             log_error(f"Error: {response.status_code}")
         last_successful_request = time.time()
         with state_lock:
-            if state != State.MESSAGE_RECEIVED:
-                state = State.IDLE
+            # The print worker owns the state while it has a message
+            if state != State.MESSAGE_RECEIVED and not prints_in_flight:
+                set_state(State.IDLE)
+        # A server without long-poll support answers right away; fall back to regular polling then
+        return response.status_code == 201 and bool(long_poll_wait) and time.monotonic() - start >= long_poll_wait
     except Exception as e:
         log_error(f"Failed to check for new messages: {e}")
         with state_lock:
-            state = State.NO_CONNECTION
+            set_state(State.NO_CONNECTION)
+        return False
 
 
 
-def handle_message(config, data):
-    global state
+def handle_transmission_failure():
     with state_lock:
-        state = State.INCOMING_TRANSMISSION
+        if state != State.MESSAGE_RECEIVED:
+            set_state(State.IDLE)
 
-    def handle_transmission_failure():
-        global state
-        with state_lock:
-            if state != State.MESSAGE_RECEIVED:
-                state = State.IDLE
+def handle_message(config, data, headers=None):
+    global prints_in_flight
+    if headers is None:
+        headers = getHeaders()
+    with state_lock:
+        set_state(State.INCOMING_TRANSMISSION)
 
     message_id = data.get("id", None)
     
@@ -641,12 +849,38 @@ def handle_message(config, data):
         handle_transmission_failure()
         return
     
-    image_path = get_image(config, message_id)
+    image_path = get_image(config, message_id, headers)
     if image_path is None:
         log_error("Failed to pull image.")
         handle_transmission_failure()
         return
 
+    # Printing takes a minute or more; hand it off so command polls keep running meanwhile
+    with state_lock:
+        prints_in_flight += 1
+    print_queue.put((message_id, image_path, headers))
+
+def print_worker():
+    """Print queued messages one at a time, then raise the flag and acknowledge each."""
+    global prints_in_flight
+    while True:
+        message_id, image_path, headers = print_queue.get()
+        try:
+            print_message(message_id, image_path, headers)
+        except Exception as e:
+            log_error(f"Error printing message {message_id}: {e}")
+            logging.exception("print_worker")
+            handle_transmission_failure()
+        finally:
+            with state_lock:
+                prints_in_flight -= 1
+
+def init_print_worker():
+    print_thread = threading.Thread(target=print_worker, daemon=True)
+    print_thread.start()
+
+def print_message(message_id, image_path, headers):
+    """Print a downloaded message and track the job; on success raise the flag and ack it."""
     job_id = print_image(image_path)
     if job_id is None:
         log_error("Failed to print.")
@@ -656,26 +890,26 @@ def handle_message(config, data):
     print_completed = track_print(job_id)
     if print_completed:
         with state_lock:
-            state = State.MESSAGE_RECEIVED
+            set_state(State.MESSAGE_RECEIVED)
         with pending_ids_lock:
             pending_message_ids.append(message_id)
             save_pending_collections()
         ack_complete_event = threading.Event()
         flag_thread = threading.Thread(target=raise_flag, args=(ack_complete_event,), daemon=True)
         flag_thread.start()
-        ack_message(message_id)
-        ack_complete_event.set()  # Signal that ACK is complete
+        # Runs on the print worker, so message polls stay paused until the ack is through
+        ack_and_notify(message_id, ack_complete_event, headers)
     else:
         log_error("Print job failed. Not ack'ing message.")
         handle_transmission_failure()
 
-def get_image(config, message_id):
+def get_image(config, message_id, headers=None):
     log_event("Getting image...")
     # Cache headers once to avoid multiple modem reads on retries
-    cached_headers = getHeaders()
+    cached_headers = headers if headers is not None else getHeaders()
     try:
         response = network_client.get_streaming(
-            f"{config['url']}{config['image_url']}/{message_id}",
+            f"{config.endpoints.image}/{message_id}",
             headers=cached_headers,
             max_attempts=3  # Fewer attempts for large downloads
         )
@@ -701,17 +935,16 @@ def save_image(config, response, message_id):
         os.makedirs(config["image_path"], exist_ok=True)
         image_path = os.path.join(config["image_path"], filename)
         
-        with open(image_path, 'wb') as f:
-            start = time.time()
-            total_bytes = 0
-            chunks = []
-            for chunk in response.iter_content(1024):
-                chunks.append(chunk)
-                total_bytes += len(chunk)
-                f.write(chunk)
-            elapsed = time.time() - start
-            speed_kbps = (total_bytes / 1024) / elapsed
-            last_download_speed = math.floor(speed_kbps)
+        # Copy straight from the socket to the file in 64 KiB blocks
+        # (unbuffered file, so each block is a single write)
+        response.raw.decode_content = True
+        with open(image_path, 'wb', buffering=0) as f:
+            start = time.monotonic()
+            shutil.copyfileobj(response.raw, f, length=64 * 1024)
+            total_bytes = f.tell()
+            # Whole milliseconds, at least 1, so a near-instant download can't divide by zero
+            elapsed_ms = max(int((time.monotonic() - start) * 1000), 1)
+            last_download_speed = total_bytes * 1000 // elapsed_ms // 1024  # KiB/s
         
         log_event(f"Image saved to {image_path}")
         return image_path
@@ -723,24 +956,44 @@ def save_image(config, response, message_id):
         log_error(f"Error saving image: {e}")
         return None
 
-def ack_message(message_id):
-    global state
+def ack_and_notify(message_id, ack_complete_event, headers=None):
+    """Acknowledge a message, then signal the flag thread even if the ack raised."""
+    try:
+        ack_message(message_id, headers)
+    except Exception as e:
+        log_error(f"Error acknowledging message {message_id}: {e}")
+    finally:
+        ack_complete_event.set()  # Signal that ACK is complete
+
+def is_server_down(error):
+    """True if the API server answered with an error or the breaker is open - a modem reboot won't fix that."""
+    return isinstance(error, (HTTPStatusError, CircuitBreakerOpenException))
+
+def ack_message(message_id, headers=None):
     log_event(f"Acknowledging message ID: {message_id}")
 
-    # Cache headers once to avoid multiple modem reads on retries
-    cached_headers = getHeaders()
+    # Cache headers once to avoid multiple modem reads on retries.
+    # Headers passed in were built before printing, so refresh the status they carry.
+    if headers is not None:
+        cached_headers = {**headers, "X-Printer-Status": get_printer_status()}
+    else:
+        cached_headers = getHeaders()
+
+    last_error = None
 
     def try_ack():
         """Try to send acknowledgment using cached headers"""
+        nonlocal last_error
         try:
             response = network_client.post(
-                f"{config['url']}{config['ack_url']}?message_id={message_id}",
+                f"{config.endpoints.ack}?message_id={message_id}",
                 headers=cached_headers,
                 max_attempts=config["retry_critical_attempts"]
             )
             log_event(response.text)
             return True
         except Exception as e:
+            last_error = e
             log_error(f"Failed to acknowledge message: {e}")
             return False
 
@@ -752,10 +1005,16 @@ def ack_message(message_id):
         log_error(f"CRITICAL: Failed to acknowledge message {message_id} after all retries")
 
         ack_data = {
-            'url': f"{config['url']}{config['ack_url']}?message_id={message_id}",
+            'url': f"{config.endpoints.ack}?message_id={message_id}",
             'message_id': message_id
         }
 
+        # The link works but the server is failing: keep the ack for later, don't reboot the modem
+        if is_server_down(last_error):
+            log_event(f"Ack message {message_id} failed because the server is down. Queued it, skipping modem reboot.")
+            recovery_manager.add_pending_ack(str(message_id), ack_data)
+            return
+
         # Skip recovery escalation if connected via wifi - modem reboot won't help
         if get_connection_type() == "wifi":
             log_event(f"Ack message {message_id} failed but connected via wifi. Skipping modem reboot.")
@@ -775,7 +1034,7 @@ def send_status():
     cached_headers = getHeaders()
     try:
         response = network_client.get(
-            f"{config['url']}{config['auth_check_url']}",
+            config.endpoints.auth_check,
             headers=cached_headers,
             max_attempts=3
         )
@@ -784,8 +1043,8 @@ def send_status():
         log_error(f"Failed to send printer status to server: {e}")
 
 def check_printer_reachable():
-    global state
     status_sent = False
+    attempt = 0
     with state_lock:
         previous_state = state
     while True:
@@ -800,27 +1059,80 @@ def check_printer_reachable():
         if is_reachable:
             if status_sent:
                 with state_lock:
-                    state = previous_state
+                    set_state(previous_state)
                 send_status()
                 log_event("Printer USB device detected again")
             return True
 
         with state_lock:
             if state != State.PRINTER_UNREACHABLE:
-                state = State.PRINTER_UNREACHABLE
+                set_state(State.PRINTER_UNREACHABLE)
         if not status_sent:
             log_error("Printer unreachable: CP1500 not found in lsusb output")
             send_status()
             status_sent = True
         else:
             log_event("Waiting for printer USB device...")
-        time.sleep(5)
+        _sleep_backoff(attempt, cap=30)
+        attempt += 1
+
+# JPEG start-of-frame markers (SOF0-SOF15, except DHT, JPG and DAC)
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+def get_image_size(image_path):
+    """
+    Get image dimensions from the JPEG/PNG header without decoding the image.
+
+    Falls back to PIL for other formats or headers that can't be parsed.
+
+    Returns:
+        tuple: (width, height) in pixels
+    """
+    try:
+        with open(image_path, 'rb') as f:
+            header = f.read(24)
+            if header.startswith(b'\x89PNG\r\n\x1a\n'):
+                # IHDR is always the first chunk: width and height at offset 16
+                return struct.unpack('>II', header[16:24])
+
+            if header.startswith(b'\xff\xd8'):
+                # Walk the JPEG segments until the start-of-frame marker
+                f.seek(2)
+                while True:
+                    byte = f.read(1)
+                    while byte and byte != b'\xff':
+                        byte = f.read(1)
+                    while byte == b'\xff':  # Skip fill bytes
+                        byte = f.read(1)
+                    if not byte:
+                        break
+                    marker = byte[0]
+                    if marker in JPEG_SOF_MARKERS:
+                        # Segment length (2) + sample precision (1), then height, width
+                        height, width = struct.unpack('>xxxHH', f.read(7))
+                        return width, height
+                    if marker in (0xD9, 0xDA):  # End of image / start of scan
+                        break
+                    if marker == 0x01 or 0xD0 <= marker <= 0xD7:  # No length field
+                        continue
+                    length = struct.unpack('>H', f.read(2))[0]
+                    f.seek(length - 2, os.SEEK_CUR)
+    except struct.error:
+        pass
+
+    from PIL import Image
+    with Image.open(image_path) as img:
+        return img.size
 
 def print_image(image_path):
     log_event("Printing image...")
-    if not os.path.exists(image_path):
+    try:
+        # Reading the header doubles as the existence check
+        width, height = get_image_size(image_path)
+    except FileNotFoundError:
         log_error("Image file not found, skipping print...")
         return None
+    is_landscape = width > height
 
     if cupsConn is None:
         log_error("CUPS connection not initialized, cannot print.")
@@ -831,18 +1143,11 @@ def print_image(image_path):
     # Check if no_print mode is enabled (for testing without wasting supplies)
     if config.get("no_print", False):
         log_event("[NO_PRINT MODE] Simulating print without actually printing")
-        with Image.open(image_path) as img:
-            width, height = img.size
-            is_landscape = width > height
         print(f"Image size: {width}x{height} ({'landscape' if is_landscape else 'portrait'})")
         log_event("[NO_PRINT MODE] ✓ Simulated job submitted (no actual print)")
         return -1  # Return fake job_id to indicate simulated print
 
     printer_name = config["printer_name"]
-    # Detect orientation
-    with Image.open(image_path) as img:
-        width, height = img.size
-        is_landscape = width > height
 
     options = {
         'media': 'custom_max_102x153mm',
@@ -861,8 +1166,18 @@ def print_image(image_path):
         log_error(f"Error processing image: {e}")
         return None
 
+# IPP job states
+JOB_STATES = {
+    3: 'pending',
+    4: 'pending-held',
+    5: 'processing',
+    6: 'processing-stopped',
+    7: 'canceled',
+    8: 'aborted',
+    9: 'completed'
+}
+
 def track_print(job_id):
-    global state
     log_event(f"Tracking job {job_id}...")
 
     # Check if this is a simulated print (no_print mode)
@@ -876,27 +1191,24 @@ def track_print(job_id):
         log_error("CUPS connection not initialized, cannot track print job.")
         return False
 
-    # IPP job states
-    job_states = {
-        3: 'pending',
-        4: 'pending-held',
-        5: 'processing',
-        6: 'processing-stopped',
-        7: 'canceled',
-        8: 'aborted',
-        9: 'completed'
-    }
     last_state = None
     last_error = None
     start_time = time.time()
     job_found = False
+    tracking_interval = config["print_tracking_interval"]
     while True:
         try:
-            jobs = cupsConn.getJobs(which_jobs='all', my_jobs=False, first_job_id=job_id, limit=1)
-            if job_id in jobs:
+            # One IPP round-trip per tick for the job's presence, state and error reasons
+            try:
+                attributes = cupsConn.getJobAttributes(job_id, requested_attributes=["job-state", "job-printer-state-reasons"])
+            except cups.IPPError as e:
+                if e.args[0] != cups.IPP_NOT_FOUND:
+                    raise
+                attributes = None  # Job not in queue
+            if attributes is not None:
                 job_found = True
-                current_state = cupsConn.getJobAttributes(job_id)["job-state"]
-                state_name = job_states.get(current_state, f'unknown({current_state})')
+                current_state = attributes.get("job-state")
+                state_name = JOB_STATES.get(current_state, f'unknown({current_state})')
 
                 if current_state is None:
                     log_error(f"Job {job_id} status is none. Stopping tracking.")
@@ -908,36 +1220,39 @@ def track_print(job_id):
 
                 # Check for completion or error states
                 if current_state == 5:
-                    reasons = cupsConn.getJobAttributes(job_id).get("job-printer-state-reasons", [])
-                    if len(reasons) > 1:
+                    raw_reasons = attributes.get("job-printer-state-reasons", ())
+                    # pycups returns a single value as a plain string rather than a one-element list
+                    reason_list = [raw_reasons] if isinstance(raw_reasons, str) else list(raw_reasons)
+                    reasons = frozenset(reason_list)
+                    if len(reason_list) > 1:
                         current_error = None
-                        if "marker-supply-empty-error" in reasons and "input-tray-missing" in reasons:
+                        if {"marker-supply-empty-error", "input-tray-missing"} <= reasons:
                             current_error = "No paper casette/ink cartridge or both"
                             with state_lock:
-                                state = State.OUT_OF_INK_AND_PAPER
+                                set_state(State.OUT_OF_INK_AND_PAPER)
                         elif "media-empty-error" in reasons:
                             current_error = "Out of paper"
                             with state_lock:
-                                state = State.OUT_OF_PAPER
+                                set_state(State.OUT_OF_PAPER)
                         elif "marker-supply-empty-error" in reasons:
                             current_error = "Out of ink or ink cartridge missing"
                             with state_lock:
-                                state = State.OUT_OF_INK
+                                set_state(State.OUT_OF_INK)
                         elif "input-tray-missing" in reasons:
                             current_error = "Paper casette missing or incorrectly inserted"
                             with state_lock:
-                                state = State.OUT_OF_PAPER
+                                set_state(State.OUT_OF_PAPER)
                         elif "media-jam-error" in reasons:
                             current_error = "Paper jam"
                             with state_lock:
-                                state = State.PAPER_JAM
+                                set_state(State.PAPER_JAM)
                         if current_error is not None and last_error != current_error:
                             log_error(current_error)
                             last_error = current_error
                             send_status()
                     elif last_error is not None:
                         with state_lock:
-                            state = State.INCOMING_TRANSMISSION
+                            set_state(State.INCOMING_TRANSMISSION)
                         last_error = None
                         send_status()
 
@@ -960,16 +1275,19 @@ def track_print(job_id):
                         log_error(f"✗ Job never found. Stopping tracking.")
                         return False
 
-            time.sleep(config["print_tracking_interval"])
+            time.sleep(tracking_interval)
 
+        except cups.IPPError as e:
+            log_error(f"CUPS error tracking job {job_id}: {e}")
+            return False
         except Exception as e:
-            log_error(f"Error tracking job: {e}")
-            traceback.print_exc()
+            log_error(f"Error tracking job {job_id}: {e}")
+            logging.exception("track_print")
             return False
     
 
 def raise_flag(ack_complete_event):
-    global flag_raised, state
+    global flag_raised
     with flag_lock:
         if flag_raised:
             log_error("Flag already raised, skipping.")
@@ -1005,7 +1323,7 @@ def raise_flag(ack_complete_event):
         if not ack_complete_event.is_set():
             log_verbose("ACK still in progress, entering ACKNOWLEDGING state...")
             with state_lock:
-                state = State.ACKNOWLEDGING
+                set_state(State.ACKNOWLEDGING)
             log_event("Waiting for acknowledgment to complete...")
             if not ack_complete_event.wait(timeout=1500):  # 25 minutes = 1500 seconds
                 log_error("Acknowledgment took longer than 25 minutes - proceeding anyway to prevent infinite hang")
@@ -1028,7 +1346,7 @@ def raise_flag(ack_complete_event):
         with state_lock:
             log_verbose(f"Current state: {state}")
             if state != State.INCOMING_TRANSMISSION:
-                state = State.IDLE
+                set_state(State.IDLE)
                 log_verbose("State set to IDLE")
 
         log_verbose("raise_flag completed successfully")
@@ -1036,7 +1354,7 @@ def raise_flag(ack_complete_event):
         log_error(f"Error in raise_flag: {e}")
         with state_lock:
             if state != State.INCOMING_TRANSMISSION:
-                state = State.IDLE
+                set_state(State.IDLE)
         with flag_lock:
             flag_raised = False
 
@@ -1049,7 +1367,7 @@ def send_collection_event(message_ids):
     cached_headers = getHeaders()
     try:
         response = network_client.post(
-            f"{config['url']}{config['collection_url']}",
+            config.endpoints.collection,
             headers=cached_headers,
             json={"message_ids": message_ids},
             max_attempts=3
@@ -1063,79 +1381,73 @@ def generate_file_name(directory, mime):
     return f"{timestamp}.{mime}"
 
 def init_servo():
-    global servo
+    global servo, servo_angle
     servo = AngularServo(config["servo_pin"], min_angle=0, max_angle=180, min_pulse_width=0.5/1000, max_pulse_width=2.5/1000)
     servo.angle = config["flag_down_angle"]
-    time.sleep(1)
+    time.sleep(1)  # Starting position unknown, allow a full sweep
     servo.detach()
+    servo_angle = config["flag_down_angle"]
 
 def set_servo_angle(angle):
-            global servo
+            global servo_detach_timer, servo_angle
             log_verbose(f"set_servo_angle called with angle={angle}")
 
             if servo is None:
                 log_error("Servo not initialized, cannot set angle.")
                 return
 
-            log_verbose(f"Setting servo.angle to {angle}")
-            servo.angle = angle
+            with servo_lock:
+                # Still attached from a recent move - keep it that way
+                if servo_detach_timer is not None:
+                    servo_detach_timer.cancel()
+                    servo_detach_timer = None
+
+                log_verbose(f"Setting servo.angle to {angle}")
+                servo.angle = angle
 
-            log_verbose("Sleeping 1 second...")
-            time.sleep(1)
+                # Wait only as long as the move needs, plus a margin for the horn to settle
+                if servo_angle is None:
+                    settle = 1
+                else:
+                    settle = max(0.12, abs(angle - servo_angle) / config["servo_degrees_per_second"] + 0.05)
+                servo_angle = angle
+                log_verbose(f"Sleeping {settle:.2f}s...")
+                time.sleep(settle)
 
-            log_verbose("Detaching servo...")
-            servo.detach()
+                log_verbose(f"Scheduling servo detach in {config['servo_detach_delay']}s...")
+                servo_detach_timer = threading.Timer(config["servo_detach_delay"], detach_servo)
+                servo_detach_timer.daemon = True
+                servo_detach_timer.start()
 
             log_verbose("set_servo_angle completed")
 
+def detach_servo():
+    """Detach the servo once no move has happened for servo_detach_delay seconds."""
+    global servo_detach_timer
+    with servo_lock:
+        # Skip if a newer move replaced this timer while it was waiting for the lock
+        if servo_detach_timer is not threading.current_thread():
+            return
+        servo_detach_timer = None
+        log_verbose("Detaching servo...")
+        servo.detach()
+
 # Function to control LED color with PWM (0.0-1.0 for each channel)
 def set_led_color(red, green, blue):
     led_red.value = red
     led_green.value = green
     led_blue.value = blue
 
-# Function to update LED status based on flag state
-def update_led_status():
-    global flag_raised
-    while True:
-        with state_lock:
-            current_state = state
-
-        match current_state:
-            case State.IDLE:
-                set_led_color(0, 1, 0)  # Green
-            case State.INCOMING_TRANSMISSION:
-                set_led_color(0, 0, 1)  # Blue
-            case State.MESSAGE_RECEIVED:
-                set_led_color(0, 1, 1)  # Cyan
-            case State.ACKNOWLEDGING:
-                set_led_color(1, 1, 1)  # White
-            case State.OUT_OF_INK:
-                set_led_color(1, 0, 0)  # Red
-            case State.OUT_OF_PAPER:
-                set_led_color(1, 0, 0)  # Red
-            case State.OUT_OF_INK_AND_PAPER:
-                set_led_color(1, 0, 0)  # Red
-            case State.PAPER_JAM:
-                set_led_color(1, 0, 0)  # Red
-            case State.WAITING_FOR_CUPS:
-                set_led_color(1, 0, 1)  # Magenta
-            case State.CONNECTION_WEAK:
-                set_led_color(1, 0.3, 0)  # Orange (network issues, retrying)
-            case State.NO_CONNECTION:
-                set_led_color(1, 0, 0)  # Red (connection lost)
-            case State.CIRCUIT_BREAKER_OPEN:
-                set_led_color(0.2, 0.8, 1)  # Light blue (server down, circuit breaker open)
-            case State.MODEM_REBOOTING:
-                set_led_color(0.8, 0, 1)  # Purple (modem rebooting)
-            case State.PRINTER_UNREACHABLE:
-                set_led_color(1, 0, 0)  # Red
-            case State.BOOTING:
-                set_led_color(1, 1, 0)  # Yellow (initializing)
-            case _:
-                set_led_color(0, 0, 0)  # Off (unknown state)
-
-        time.sleep(0.5)
+# Function to update LED status based on state (called on every state change)
+def update_led_status(current_state):
+    global led_color
+    if led_red is None:
+        return  # LEDs not initialized yet, init_led() paints the current state
+
+    color = STATE_COLOR.get(current_state, (0, 0, 0))
+    if color != led_color:  # e.g. OUT_OF_PAPER -> NO_CONNECTION stays red
+        set_led_color(*color)
+        led_color = color
 
 # Function to control paper LED color with PWM (0.0-1.0 for each channel)
 def set_paper_led_color(red, green, blue):
@@ -1143,20 +1455,15 @@ def set_paper_led_color(red, green, blue):
     paper_led_green.value = green
     paper_led_blue.value = blue
 
-# Function to update LED status based on flag state
-def update_paper_led_status():
-    while True:
-        set_paper_led_color(1, 0, 0)
-        time.sleep(0.5)
-
 def init_led():
     global led_red, led_green, led_blue
     led_red = PWMLED(config["led_pins"]["red"])
     led_green = PWMLED(config["led_pins"]["green"])
     led_blue = PWMLED(config["led_pins"]["blue"])
 
-    led_thread = threading.Thread(target=update_led_status, daemon=True)
-    led_thread.start()
+    # From here on set_state() repaints the LED on every state change
+    with state_lock:
+        update_led_status(state)
 
 def init_paper_led():
     global paper_led_red, paper_led_green, paper_led_blue
@@ -1165,8 +1472,8 @@ def init_paper_led():
         paper_led_green = PWMLED(config["paper_led_pins"]["green"])
         paper_led_blue = PWMLED(config["paper_led_pins"]["blue"])
 
-        paper_led_thread = threading.Thread(target=update_paper_led_status, daemon=True)
-        paper_led_thread.start()
+        # The color never changes, the PWM outputs hold it
+        set_paper_led_color(1, 0, 0)
 
         log_event("This model has an out-of-paper indicator light. It's been switched on.")
     else:
@@ -1224,13 +1531,13 @@ def init_GPIO():
     polling_thread = threading.Thread(target=polling_button_handler, daemon=True)
     polling_thread.start()
 
-def check_for_new_commands():
+def check_for_new_commands(headers=None):
     global last_successful_command_request
     # Cache headers once to avoid multiple modem reads on retries
-    cached_headers = getHeaders()
+    cached_headers = headers if headers is not None else getHeaders()
     try:
         response = network_client.get(
-            config["url"] + config["command_url"],
+            config.endpoints.command,
             headers=cached_headers,
             max_attempts=5
         )
@@ -1239,7 +1546,7 @@ def check_for_new_commands():
             dispatchCommand(response.json())
         # elif response.status_code == 201:
         #     print("No new commands found")
-        #     print("[" + datetime.now().strftime("%Y-%m-%d %H:%M:%S") + "] No new messages found")
+        #     log_console("No new messages found")
         elif response.status_code != 201:
             log_error(f"Command check error: {response.status_code}")
         last_successful_command_request = time.time()
@@ -1271,17 +1578,21 @@ def ackCommand(command_id):
     # Cache headers once to avoid multiple modem reads on retries
     cached_headers = getHeaders()
 
+    last_error = None
+
     def try_ack():
         """Try to send command acknowledgment using cached headers"""
+        nonlocal last_error
         try:
             response = network_client.post(
-                f"{config['url']}{config['command_ack_url']}?command_id={command_id}",
+                f"{config.endpoints.command_ack}?command_id={command_id}",
                 headers=cached_headers,
                 max_attempts=config["retry_critical_attempts"]
             )
             log_event(response.text)
             return True
         except Exception as e:
+            last_error = e
             log_error(f"Failed to acknowledge command: {e}")
             return False
 
@@ -1293,10 +1604,16 @@ def ackCommand(command_id):
         log_error(f"CRITICAL: Failed to acknowledge command {command_id} after all retries")
 
         ack_data = {
-            'url': f"{config['url']}{config['command_ack_url']}?command_id={command_id}",
+            'url': f"{config.endpoints.command_ack}?command_id={command_id}",
             'command_id': command_id
         }
 
+        # The link works but the server is failing: keep the ack for later, don't reboot the modem
+        if is_server_down(last_error):
+            log_event(f"Ack command {command_id} failed because the server is down. Queued it, skipping modem reboot.")
+            recovery_manager.add_pending_ack(str(command_id), ack_data)
+            return
+
         # Skip recovery escalation if connected via wifi - modem reboot won't help
         if get_connection_type() == "wifi":
             log_event(f"Ack command {command_id} failed but connected via wifi. Skipping modem reboot.")
@@ -1311,23 +1628,27 @@ def ackCommand(command_id):
         )
 
 def reboot():
-    command = ["sudo", "reboot"]
-    subprocess.run(command)
+    try:
+        power_action("reboot", LINUX_REBOOT_CMD_RESTART)
+    except OSError as e:
+        log_error(str(e))
 def shutdown():
-    command = ["sudo", "poweroff"]
-    subprocess.run(command)
+    try:
+        power_action("poweroff", LINUX_REBOOT_CMD_POWER_OFF)
+    except OSError as e:
+        log_error(str(e))
 def flagUp():
     set_servo_angle(config["flag_up_angle"])
 def flagDown():
     set_servo_angle(config["flag_down_angle"])
 
 def init_CUPS():
-    global cupsConn, state
+    global cupsConn
     log_event(f"Waiting {config['initial_delay']}s before connecting to cups")
     with state_lock:
-        state = State.WAITING_FOR_CUPS
+        set_state(State.WAITING_FOR_CUPS)
     time.sleep(config["initial_delay"])
-    start = time.time()
+    start = time.monotonic()  # Immune to the clock jump when NTP syncs during boot
     attempt = 1
     state_sent = False
     while True:
@@ -1336,17 +1657,18 @@ def init_CUPS():
             cupsConn.getPrinters()
             log_event("CUPS connected")
             with state_lock:
-                state = State.BOOTING
+                set_state(State.BOOTING)
             if state_sent:
                 send_status()
             break
         except RuntimeError as e:
-            print(f"Connection failed. {time.time() - start}s since start. Attempt [{attempt + 1}/{config['cups_retries']}]")
+            print(f"Connection failed. {time.monotonic() - start:.0f}s since start. Attempt [{attempt + 1}/{config['cups_retries']}]")
             if not state_sent:
                 send_status()
                 state_sent = True
-            time.sleep(1)
-            if time.time() - start > 300:
+            # 1s, 2s, 4s, then every ~8s while cupsd is still starting
+            _sleep_backoff(attempt - 1, cap=8)
+            if time.monotonic() - start > 300:
                 log_error("Cups hasn't started in 5 minutes. Rebooting...")
                 reboot()
             attempt += 1
@@ -1368,6 +1690,9 @@ def clear_all_print_jobs():
         log_event("No existing print jobs found.")
 
 if __name__ == "__main__":
+    atexit.register(release_resources)
+    # systemd stops the service with SIGTERM; exit through the normal path so atexit hooks run
+    signal.signal(signal.SIGTERM, lambda *_: shutdown_gracefully(0))
     log_event(f"GPK {VERSION} started")
     init_config()
     log_event("conf loaded from file")
@@ -1386,20 +1711,39 @@ if __name__ == "__main__":
     log_event("Servo initialized")
     init_CUPS()
     log_event("CUPS initialized")
+    init_print_worker()
+    log_event("Print worker started")
     check_printer_reachable()
     log_event("Printer reachable")
     with state_lock:
-        state = State.IDLE
+        set_state(State.IDLE)
     consecutive_errors = 0
     max_consecutive_errors = config["max_consecutive_errors"]
+    # Each periodic check has its own deadline; the loop sleeps until the earliest one
+    next_command_check = next_message_check = time.monotonic()
     while True:
         try:
             # check_supply_levels()
             # Check for commands first, then messages
-            check_for_new_commands()
-            check_for_new_messages()
-            time.sleep(config["check_interval"])
+            # While the circuit breaker is open every request would be rejected, so skip
+            # building headers and wait for its cooldown; the next poll is the half-open probe
+            cooldown_remaining = network_client.circuit_cooldown_remaining()
+            if cooldown_remaining > 0:
+                log_verbose(f"Circuit breaker open, next poll in {cooldown_remaining:.0f}s")
+                time.sleep(cooldown_remaining)
+                continue
+            now = time.monotonic()
+            # Build headers once per wake and share them between the due checks
+            headers = getHeaders()
+            if now >= next_command_check:
+                check_for_new_commands(headers)
+                next_command_check = time.monotonic() + config["command_check_interval"]
+            if now >= next_message_check:
+                # After a held long-poll the next message check is due right away
+                held = check_for_new_messages(headers)
+                next_message_check = time.monotonic() + (0 if held else config["check_interval"])
             consecutive_errors = 0  # Reset on success
+            time.sleep(max(0, min(next_command_check, next_message_check) - time.monotonic()))
         except KeyboardInterrupt:
             log_event("Keyboard interrupt received, shutting down gracefully...")
             break
@@ -1410,4 +1754,4 @@ if __name__ == "__main__":
             if consecutive_errors >= max_consecutive_errors:
                 log_error(f"Too many consecutive errors ({max_consecutive_errors}), shutting down...")
                 break
-            time.sleep(5)  # Wait before retrying after error
+            _sleep_backoff(consecutive_errors)  # Back off further with each consecutive error
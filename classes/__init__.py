@@ -4,6 +4,12 @@ Classes module for GB Side Software.
 This module contains reusable classes for various hardware interfaces.
 """
 
-from .huawei_modem_reader import HuaweiModemReader
-
 __all__ = ['HuaweiModemReader']
+
+
+def __getattr__(name):
+    # Deferred so importing a sibling module doesn't pull in huawei_lte_api
+    if name == 'HuaweiModemReader':
+        from .huawei_modem_reader import HuaweiModemReader
+        return HuaweiModemReader
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
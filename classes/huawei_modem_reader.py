@@ -33,17 +33,20 @@ class HuaweiModemReader:
 
     # Network type mapping from modem codes to readable names
     NETWORK_TYPE_MAP = {
-        '0': 'No Service',
-        '1': 'GSM', '2': 'GPRS', '3': 'EDGE',
-        '4': 'WCDMA', '5': 'HSDPA', '6': 'HSUPA', '7': 'HSPA',
-        '8': 'TDSCDMA', '9': 'HSPA+',
-        '10': 'EVDO Rev.0', '11': 'EVDO Rev.A', '12': 'EVDO Rev.B',
-        '13': '1xRTT', '14': 'UMB', '15': '1xEVDV', '16': '3xRTT',
-        '17': 'HSPA+ 64QAM', '18': 'HSPA+ MIMO',
-        '19': 'LTE', '41': 'LTE CA',
-        '101': 'NR5G NSA', '102': 'NR5G SA'
+        0: 'No Service',
+        1: 'GSM', 2: 'GPRS', 3: 'EDGE',
+        4: 'WCDMA', 5: 'HSDPA', 6: 'HSUPA', 7: 'HSPA',
+        8: 'TDSCDMA', 9: 'HSPA+',
+        10: 'EVDO Rev.0', 11: 'EVDO Rev.A', 12: 'EVDO Rev.B',
+        13: '1xRTT', 14: 'UMB', 15: '1xEVDV', 16: '3xRTT',
+        17: 'HSPA+ 64QAM', 18: 'HSPA+ MIMO',
+        19: 'LTE', 41: 'LTE CA',
+        101: 'NR5G NSA', 102: 'NR5G SA'
     }
 
+    # Leading signed integer in values like "-116dBm"
+    _SIGNAL_RE = re.compile(r'-?\d+')
+
     def __init__(self, url: str = "http://192.168.8.1", timeout: int = 10):
         """
         Initialize the HuaweiModemReader.
@@ -70,6 +73,17 @@ class HuaweiModemReader:
             self.connection.__exit__(exc_type, exc_val, exc_tb)
         return False
 
+    def reconnect(self):
+        """Drop the current session and establish a fresh one, e.g. after a modem reboot."""
+        if self.connection:
+            try:
+                self.connection.__exit__(None, None, None)
+            except Exception:
+                pass  # Old session is already dead, nothing to clean up
+        self.connection = None
+        self.client = None
+        self.__enter__()
+
     @staticmethod
     def _parse_signal_value(value) -> int | None:
         """
@@ -86,7 +100,9 @@ class HuaweiModemReader:
         """
         if value is None:
             return None
-        match = re.search(r'-?\d+', str(value))
+        if isinstance(value, int):
+            return value
+        match = HuaweiModemReader._SIGNAL_RE.search(value if isinstance(value, str) else str(value))
         return int(match.group()) if match else None
 
     def _get_signal_info(self) -> dict:
@@ -122,6 +138,10 @@ class HuaweiModemReader:
             raise RuntimeError("Client not connected. Use context manager (with statement).")
         return self.client.net.current_plmn()
 
+    def _fetch_all(self) -> tuple:
+        """Fetch signal, status and PLMN info in one go."""
+        return self._get_signal_info(), self._get_status_info(), self._get_plmn_info()
+
     def get_signal_data(self) -> dict:
         """
         Get complete signal data and status from the modem.
@@ -143,10 +163,14 @@ class HuaweiModemReader:
                 'network_mode': 'LTE'
             }
         """
-        # Fetch all required data
-        signal_info = self._get_signal_info()
-        status_info = self._get_status_info()
-        plmn_info = self._get_plmn_info()
+        # Fetch all required data, logging in again once if the session went stale
+        try:
+            signal_info, status_info, plmn_info = self._fetch_all()
+        except RuntimeError:
+            raise
+        except Exception:
+            self.reconnect()
+            signal_info, status_info, plmn_info = self._fetch_all()
 
         # Parse signal metrics (all as integers)
         rsrp = self._parse_signal_value(signal_info.get('rsrp'))
@@ -161,9 +185,13 @@ class HuaweiModemReader:
         )
 
         # Parse network mode
-        network_type_raw = str(status_info.get('CurrentNetworkType', '0'))
+        network_type_raw = status_info.get('CurrentNetworkType', 0)
+        try:
+            network_type = int(network_type_raw)
+        except (TypeError, ValueError):
+            network_type = None
         network_mode = self.NETWORK_TYPE_MAP.get(
-            network_type_raw,
+            network_type,
             f"Unknown ({network_type_raw})"
         )
 
@@ -1,11 +1,15 @@
 import requests
 from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.connection import HTTPConnection
+import socket
 import time
 import random
 from enum import Enum
 from typing import Optional, Callable, Any
 import logging
 import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 
 class CircuitBreakerOpenException(Exception):
@@ -13,6 +17,18 @@ class CircuitBreakerOpenException(Exception):
     pass
 
 
+class HTTPStatusError(Exception):
+    """Raised for a retryable HTTP status; the message is only formatted when shown."""
+
+    def __init__(self, status: int, url: str):
+        super().__init__(status, url)
+        self.status = status
+        self.url = url
+
+    def __str__(self):
+        return f"{self.status} response from {self.url}"
+
+
 class CircuitState(Enum):
     CLOSED = "closed"  # Normal operation
     OPEN = "open"      # Failing, reject requests
@@ -30,62 +46,109 @@ class CircuitBreaker:
 
     Only opens if the target server is down but internet connectivity exists.
     If internet is down (modem issue), keeps trying without opening.
+
+    Each time the circuit re-opens without having recovered, the cooldown is
+    multiplied by cooldown_factor (capped at cooldown_max), so a long outage
+    is probed less and less often.
     """
 
     def __init__(self, failure_threshold: int = 5, cooldown: int = 60,
+                 cooldown_factor: float = 2.0, cooldown_max: int = 900,
+                 success_threshold: int = 2,
                  connectivity_check_urls: list = None,
+                 probe_session: Optional[requests.Session] = None,
                  on_breaker_open: Optional[Callable] = None,
                  on_breaker_close: Optional[Callable] = None):
         self.failure_threshold = failure_threshold
         self.cooldown = cooldown
+        self.cooldown_factor = cooldown_factor
+        self.cooldown_max = cooldown_max
+        self.current_cooldown = cooldown
+        self.open_count = 0  # Consecutive opens without a successful test
+        self.success_threshold = success_threshold
+        self.successes = 0  # Consecutive successes while HALF_OPEN
         self.failures = 0
-        self.last_failure_time = None
+        self.last_failure_time = None  # time.monotonic(), immune to wall-clock jumps
         self.state = CircuitState.CLOSED
         self.connectivity_check_urls = connectivity_check_urls or [
             "https://www.google.com",
             "https://1.1.1.1",  # Cloudflare DNS
             "https://8.8.8.8"   # Google DNS
         ]
+        # Long-lived so repeated probes reuse their connections
+        self.probe_session = probe_session or requests.Session()
         self.on_breaker_open = on_breaker_open
         self.on_breaker_close = on_breaker_close
         self.lock = threading.Lock()  # Protect state and failures
+        self.checking_connectivity = False  # A thread is deciding whether to open
 
     def call(self, func: Callable, *args, **kwargs) -> Any:
         """Execute function through circuit breaker"""
-        with self.lock:
-            if self.state == CircuitState.OPEN:
-                if time.time() - self.last_failure_time > self.cooldown:
-                    logging.info("Circuit breaker entering HALF_OPEN state for testing")
-                    self.state = CircuitState.HALF_OPEN
-                else:
-                    raise CircuitBreakerOpenException(f"Circuit breaker is OPEN. Service unavailable. Retry in {int(self.cooldown - (time.time() - self.last_failure_time))}s")
+        # Attribute reads are atomic, so the common CLOSED case skips the lock
+        # entirely; any other state is re-checked under the lock before acting on it
+        if self.state is CircuitState.OPEN:
+            with self.lock:
+                if self.state == CircuitState.OPEN:
+                    if time.monotonic() - self.last_failure_time > self.current_cooldown:
+                        logging.info("Circuit breaker entering HALF_OPEN state for testing")
+                        self.state = CircuitState.HALF_OPEN
+                    else:
+                        raise CircuitBreakerOpenException(f"Circuit breaker is OPEN. Service unavailable. Retry in {int(self.current_cooldown - (time.monotonic() - self.last_failure_time))}s")
 
         try:
             result = func(*args, **kwargs)
-            with self.lock:
-                if self.state == CircuitState.HALF_OPEN:
-                    logging.info("Circuit breaker test successful, resetting to CLOSED")
-                    self._reset_unlocked()  # Already have lock
+            if self.state is CircuitState.HALF_OPEN:
+                with self.lock:
+                    if self.state == CircuitState.HALF_OPEN:
+                        self.successes += 1
+                        if self.successes >= self.success_threshold:
+                            logging.info(f"Circuit breaker test successful {self.successes}x, resetting to CLOSED")
+                            self._reset_unlocked()  # Already have lock
             return result
         except Exception as e:
             self.record_failure()
             raise e
 
+    def peek_state(self) -> CircuitState:
+        """Current state read without the lock; may be momentarily stale"""
+        return self.state
+
+    def cooldown_remaining(self) -> float:
+        """Seconds until an OPEN circuit lets a test request through (0 if not rejecting)"""
+        if self.state is not CircuitState.OPEN:
+            return 0
+        with self.lock:
+            if self.state != CircuitState.OPEN:
+                return 0
+            return max(0, self.current_cooldown - (time.monotonic() - self.last_failure_time))
+
     def check_internet_connectivity(self) -> bool:
         """
         Check if we have internet connectivity by testing known reliable servers.
         Returns True if we can reach at least one test server.
+
+        All servers are probed at once and the first success wins, so a full
+        outage costs one timeout instead of one per server.
         """
-        for url in self.connectivity_check_urls:
-            try:
-                # Quick HEAD request with short timeout
-                response = requests.head(url, timeout=3)
-                if response.status_code < 500:  # Any response except server error means connectivity exists
-                    logging.info(f"Internet connectivity confirmed via {url}")
-                    return True
-            except Exception:
-                # Try next URL
-                continue
+        def probe(url):
+            # Quick HEAD request; short connect timeout so an unreachable host fails fast
+            response = self.probe_session.head(url, timeout=(2, 3))
+            return response.status_code < 500  # Any response except server error means connectivity exists
+
+        executor = ThreadPoolExecutor(max_workers=len(self.connectivity_check_urls))
+        try:
+            futures = {executor.submit(probe, url): url for url in self.connectivity_check_urls}
+            for future in as_completed(futures):
+                try:
+                    if future.result():
+                        logging.info(f"Internet connectivity confirmed via {futures[future]}")
+                        return True
+                except Exception:
+                    # Wait for the next server
+                    continue
+        finally:
+            # Don't wait for the slower probes once we have an answer
+            executor.shutdown(wait=False, cancel_futures=True)
 
         logging.warning("Internet connectivity check failed - cannot reach any test servers")
         return False
@@ -96,41 +159,63 @@ class CircuitBreaker:
         Only opens if internet connectivity exists (meaning the target server is down).
         If internet is down, keeps circuit closed so we keep trying.
         """
-        should_check_internet = False
         with self.lock:
             self.failures += 1
-            self.last_failure_time = time.time()
-
-            if self.failures >= self.failure_threshold and self.state != CircuitState.OPEN:
-                should_check_internet = True
+            self.successes = 0
+            self.last_failure_time = time.monotonic()
+
+            # The whole open decision is made here; the flag makes sure only one
+            # thread runs the connectivity check and applies its outcome
+            should_check_internet = (
+                self.failures >= self.failure_threshold
+                and self.state != CircuitState.OPEN
+                and not self.checking_connectivity
+            )
+            if not should_check_internet:
+                return
+            self.checking_connectivity = True
 
         # Check internet connectivity without holding lock (can be slow)
-        if should_check_internet:
+        try:
             has_internet = self.check_internet_connectivity()
+        except Exception:
+            has_internet = False
 
-            with self.lock:
-                if self.failures >= self.failure_threshold and self.state != CircuitState.OPEN:
-                    if has_internet:
-                        logging.warning(
-                            f"Circuit breaker OPENING after {self.failures} consecutive failures. "
-                            f"Internet is up, target server appears down."
-                        )
-                        self.state = CircuitState.OPEN
-                        if self.on_breaker_open:
-                            self.on_breaker_open()
-                    else:
-                        logging.warning(
-                            f"Not opening circuit breaker despite {self.failures} failures - "
-                            f"internet connectivity is down (likely modem issue). Will keep retrying."
-                        )
-                        # Don't open the circuit, but reset failure count to avoid log spam
-                        # We'll check again after more failures
-                        self.failures = self.failure_threshold - 1
+        with self.lock:
+            self.checking_connectivity = False
+            # A success during the probe (e.g. HALF_OPEN closing the circuit)
+            # resets the failures; don't undo it with a stale decision
+            if self.failures < self.failure_threshold or self.state == CircuitState.OPEN:
+                return
+            if has_internet:
+                self.current_cooldown = min(
+                    self.cooldown * self.cooldown_factor ** self.open_count,
+                    self.cooldown_max
+                )
+                self.open_count += 1
+                logging.warning(
+                    f"Circuit breaker OPENING after {self.failures} consecutive failures. "
+                    f"Internet is up, target server appears down. Cooldown {self.current_cooldown:.0f}s."
+                )
+                self.state = CircuitState.OPEN
+                if self.on_breaker_open:
+                    self.on_breaker_open()
+            else:
+                logging.warning(
+                    f"Not opening circuit breaker despite {self.failures} failures - "
+                    f"internet connectivity is down (likely modem issue). Will keep retrying."
+                )
+                # Don't open the circuit, but reset failure count to avoid log spam
+                # We'll check again after more failures
+                self.failures = self.failure_threshold - 1
 
     def _reset_unlocked(self):
         """Reset circuit breaker to closed state (must be called with lock held)"""
         was_open = self.state == CircuitState.OPEN
         self.failures = 0
+        self.successes = 0
+        self.open_count = 0
+        self.current_cooldown = self.cooldown
         self.state = CircuitState.CLOSED
         if was_open and self.on_breaker_close:
             self.on_breaker_close()
@@ -141,6 +226,30 @@ class CircuitBreaker:
             self._reset_unlocked()
 
 
+class KeepaliveHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that enables TCP keepalive on its sockets.
+
+    The LTE modem's NAT silently drops idle mappings; keepalive probes make a
+    dead pooled connection fail within ~60s instead of stalling the next
+    request until its read timeout.
+    """
+
+    # urllib3's defaults (TCP_NODELAY) plus keepalive: first probe after 30s idle,
+    # then every 10s, giving up after 3 unanswered probes
+    SOCKET_OPTIONS = HTTPConnection.default_socket_options + [
+        (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+    ] + ([
+        (socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 30),
+        (socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 10),
+        (socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3),
+    ] if hasattr(socket, "TCP_KEEPIDLE") else [])
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = self.SOCKET_OPTIONS
+        super().init_poolmanager(*args, **kwargs)
+
+
 class NetworkClient:
     """
     HTTP client with connection pooling, keepalive, exponential backoff retry,
@@ -157,14 +266,21 @@ class NetworkClient:
     def __init__(self,
                  pool_connections: int = 10,
                  pool_maxsize: int = 20,
-                 keepalive_timeout: int = 60,
+                 keepalive_timeout: int = 75,
+                 keepalive_max: int = 1000,
                  connect_timeout: int = 10,
                  read_timeout: int = 30,
                  retry_max_attempts: int = 3,
                  retry_backoff_factor: float = 2.0,
                  retry_max_delay: int = 60,
+                 retry_base_delay: float = 1.0,
+                 retry_jitter: float = 0.3,
+                 retry_jitter_mode: str = "full",
                  circuit_breaker_threshold: int = 5,
                  circuit_breaker_cooldown: int = 60,
+                 circuit_breaker_cooldown_factor: float = 2.0,
+                 circuit_breaker_cooldown_max: int = 900,
+                 circuit_breaker_success_threshold: int = 2,
                  connectivity_check_urls: Optional[list] = None,
                  on_connection_weak: Optional[Callable] = None,
                  on_connection_lost: Optional[Callable] = None,
@@ -178,13 +294,21 @@ class NetworkClient:
             pool_connections: Number of connection pools to cache
             pool_maxsize: Maximum number of connections in each pool
             keepalive_timeout: How long to keep connections alive (seconds)
+            keepalive_max: Requests to allow on one connection before the server may close it
             connect_timeout: Timeout for establishing connection (seconds)
             read_timeout: Timeout for reading response (seconds)
             retry_max_attempts: Maximum retry attempts
             retry_backoff_factor: Exponential backoff multiplier
             retry_max_delay: Maximum delay between retries (seconds)
+            retry_base_delay: Delay before the first retry, before jitter (seconds)
+            retry_jitter: Maximum random extra delay, as a fraction of the delay ("proportional" mode)
+            retry_jitter_mode: "full" (uniform between 0 and the exponential delay) or
+                "proportional" (delay plus up to retry_jitter of it)
             circuit_breaker_threshold: Failures before opening circuit
-            circuit_breaker_cooldown: Cooldown period when circuit is open (seconds)
+            circuit_breaker_cooldown: Cooldown period when circuit first opens (seconds)
+            circuit_breaker_cooldown_factor: Cooldown multiplier for each re-open without recovery
+            circuit_breaker_cooldown_max: Upper bound for the grown cooldown (seconds)
+            circuit_breaker_success_threshold: Consecutive HALF_OPEN successes needed to close the circuit
             connectivity_check_urls: URLs to check for internet connectivity (defaults to google, cloudflare, google DNS)
             on_connection_weak: Callback to call when first connection failure occurs
             on_connection_lost: Callback to call when connection is completely lost
@@ -197,20 +321,61 @@ class NetworkClient:
         self.retry_max_attempts = retry_max_attempts
         self.retry_backoff_factor = retry_backoff_factor
         self.retry_max_delay = retry_max_delay
+        self.retry_base_delay = retry_base_delay
+        if retry_jitter_mode not in self.JITTER_MODES:
+            # A typo in the config shouldn't stop an unattended device from polling
+            logging.warning(f"Unknown retry_jitter_mode {retry_jitter_mode!r}, using 'full' "
+                            f"(expected one of {', '.join(self.JITTER_MODES)})")
+            retry_jitter_mode = "full"
+        self.retry_jitter = retry_jitter
+        self.retry_jitter_mode = retry_jitter_mode
+        # Seeded from the OS so devices restarted together don't draw the same delays
+        self._rng = random.SystemRandom()
+        # Capped exponential delay per attempt, computed once until it reaches
+        # retry_max_delay; later attempts reuse the last entry. Callers pass their
+        # own max_attempts, so the table can't be sized from retry_max_attempts.
+        # The length limit only matters for a backoff factor <= 1.
+        backoff_caps = []
+        delay = retry_base_delay
+        while len(backoff_caps) < 64:
+            backoff_caps.append(min(delay, retry_max_delay))
+            if delay >= retry_max_delay:
+                break
+            delay *= retry_backoff_factor
+        self._backoff_caps = tuple(backoff_caps)
         self.on_connection_weak = on_connection_weak
         self.on_connection_lost = on_connection_lost
         self.on_connection_restored = on_connection_restored
         self.connection_failed = False
         self.connection_weak = False
+        # Requests run on several threads; flag transitions are decided under this
+        # lock so each callback fires once, and the callbacks run after it's released
+        self.connection_lock = threading.Lock()
 
         # Create session with connection pooling
         self.session = requests.Session()
 
+        # One quick transport-level retry for gateway errors. Retry-After is ignored:
+        # urllib3 would sleep for whatever the server asks (hours, on 2.x) outside
+        # every timeout, and request_with_retry() already backs off. Connection/read
+        # errors are left to request_with_retry(), and the final response is
+        # returned rather than raised so _send() can classify it.
+        transport_retry = Retry(
+            total=1,
+            connect=0,
+            read=0,
+            backoff_factor=0.5,
+            status_forcelist=(502, 503, 504),
+            respect_retry_after_header=False,
+            raise_on_status=False
+        )
+
         # Configure HTTPAdapter for keepalive and connection pooling
-        adapter = HTTPAdapter(
+        adapter = KeepaliveHTTPAdapter(
             pool_connections=pool_connections,
             pool_maxsize=pool_maxsize,
-            pool_block=False
+            pool_block=False,
+            max_retries=transport_retry
         )
 
         self.session.mount('http://', adapter)
@@ -219,18 +384,48 @@ class NetworkClient:
         # Set keepalive headers
         self.session.headers.update({
             'Connection': 'keep-alive',
-            'Keep-Alive': f'timeout={keepalive_timeout}'
+            'Keep-Alive': f'timeout={keepalive_timeout}, max={keepalive_max}'
         })
 
+        # Separate session for connectivity probes so they don't occupy the API pool
+        self.probe_session = requests.Session()
+
         # Circuit breaker for each client instance
         self.circuit_breaker = CircuitBreaker(
             failure_threshold=circuit_breaker_threshold,
             cooldown=circuit_breaker_cooldown,
+            cooldown_factor=circuit_breaker_cooldown_factor,
+            cooldown_max=circuit_breaker_cooldown_max,
+            success_threshold=circuit_breaker_success_threshold,
             connectivity_check_urls=connectivity_check_urls,
+            probe_session=self.probe_session,
             on_breaker_open=on_circuit_breaker_open,
             on_breaker_close=on_circuit_breaker_close
         )
 
+    # Accepted values for retry_jitter_mode
+    JITTER_MODES = ("full", "proportional")
+
+    # Server-side statuses that are retried and count as circuit breaker failures
+    RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+
+    # Errors that can go away on their own; anything else (invalid URL, bad
+    # arguments, undecodable content) is raised on the first attempt
+    RETRYABLE_EXCEPTIONS = (
+        requests.exceptions.ConnectionError,
+        requests.exceptions.Timeout,
+        requests.exceptions.ChunkedEncodingError,
+        HTTPStatusError,  # Only raised by _send() for RETRYABLE_STATUS_CODES
+    )
+
+    def _send(self, method: str, url: str, timeout: tuple, **kwargs) -> requests.Response:
+        """Send a single request, raising HTTPStatusError for retryable status codes"""
+        response = self.session.request(method=method, url=url, timeout=timeout, **kwargs)
+        if response.status_code in self.RETRYABLE_STATUS_CODES:
+            response.close()
+            raise HTTPStatusError(response.status_code, url)
+        return response
+
     def _exponential_backoff_with_jitter(self, attempt: int) -> float:
         """
         Calculate backoff delay with exponential growth and jitter.
@@ -244,13 +439,12 @@ class NetworkClient:
         Returns:
             Delay in seconds with jitter applied
         """
-        # Calculate exponential delay, capped at max_delay
-        delay = min(
-            self.retry_backoff_factor ** attempt,
-            self.retry_max_delay
-        )
-        # Add random jitter (0 to 30% of delay)
-        jitter = random.uniform(0, delay * 0.3)
+        delay = self._backoff_caps[min(attempt, len(self._backoff_caps) - 1)]
+        if self.retry_jitter_mode == "full":
+            # Spread retries over the whole window rather than clustering at its end
+            return self._rng.uniform(0, delay)
+        # Add random jitter (0 to retry_jitter of delay)
+        jitter = self._rng.uniform(0, delay * self.retry_jitter)
         return delay + jitter
 
     def request_with_retry(self,
@@ -275,6 +469,12 @@ class NetworkClient:
         Raises:
             Exception if all retries exhausted or circuit breaker is open
         """
+        # Reject straight away while the breaker is cooling down
+        if self.circuit_breaker.peek_state() is CircuitState.OPEN:
+            remaining = self.circuit_breaker.cooldown_remaining()
+            if remaining > 0:
+                raise CircuitBreakerOpenException(f"Circuit breaker is OPEN. Service unavailable. Retry in {int(remaining)}s")
+
         if max_attempts is None:
             max_attempts = self.retry_max_attempts
 
@@ -287,7 +487,7 @@ class NetworkClient:
             try:
                 # Use circuit breaker to protect against failing service
                 response = self.circuit_breaker.call(
-                    self.session.request,
+                    self._send,
                     method=method,
                     url=url,
                     timeout=timeout,
@@ -296,9 +496,11 @@ class NetworkClient:
 
                 # Connection succeeded - restore state if we were in failed state
                 if self.connection_failed or self.connection_weak:
-                    self.connection_failed = False
-                    self.connection_weak = False
-                    if self.on_connection_restored:
+                    with self.connection_lock:
+                        restored = self.connection_failed or self.connection_weak
+                        self.connection_failed = False
+                        self.connection_weak = False
+                    if restored and self.on_connection_restored:
                         logging.info("Connection restored")
                         self.on_connection_restored()
 
@@ -308,13 +510,16 @@ class NetworkClient:
                 # Circuit breaker is open - don't retry, let it handle its own cooldown
                 raise
 
-            except Exception as e:
+            except self.RETRYABLE_EXCEPTIONS as e:
                 last_exception = e
 
                 # First failure - mark connection as weak
-                if attempt == 0 and not self.connection_weak and not self.connection_failed:
-                    self.connection_weak = True
-                    if self.on_connection_weak:
+                if attempt == 0:
+                    with self.connection_lock:
+                        became_weak = not self.connection_weak and not self.connection_failed
+                        if became_weak:
+                            self.connection_weak = True
+                    if became_weak and self.on_connection_weak:
                         logging.warning("Connection weak - first failure detected")
                         self.on_connection_weak()
 
@@ -329,13 +534,16 @@ class NetworkClient:
                     logging.error(
                         f"Request to {url} failed after {max_attempts} attempts: {e}"
                     )
-                    # All retries exhausted - mark connection as completely failed
-                    if not self.connection_failed:
-                        self.connection_failed = True
-                        self.connection_weak = False  # No longer weak, it's completely lost
-                        if self.on_connection_lost:
-                            logging.warning("Connection lost - all retries exhausted")
-                            self.on_connection_lost()
+                    # All retries exhausted - mark connection as completely failed,
+                    # unless the breaker just opened: then the server is down, not our link
+                    with self.connection_lock:
+                        lost = not self.connection_failed and self.circuit_breaker.state != CircuitState.OPEN
+                        if lost:
+                            self.connection_failed = True
+                            self.connection_weak = False  # No longer weak, it's completely lost
+                    if lost and self.on_connection_lost:
+                        logging.warning("Connection lost - all retries exhausted")
+                        self.on_connection_lost()
 
         raise last_exception
 
@@ -392,6 +600,11 @@ class NetworkClient:
             timeout = (self.connect_timeout, 60)
         return self.request_with_retry('GET', url, max_attempts, timeout, **kwargs)
 
+    def circuit_cooldown_remaining(self) -> float:
+        """Seconds the circuit breaker will keep rejecting requests (0 if requests can go out)"""
+        return self.circuit_breaker.cooldown_remaining()
+
     def close(self):
-        """Close the session and cleanup connections"""
+        """Close the sessions and cleanup connections"""
         self.session.close()
+        self.probe_session.close()
@@ -1,10 +1,41 @@
+import ctypes
 import json
 import os
 import logging
+import random
 import subprocess
+import threading
 import time
 from typing import Dict, Any, Optional, Callable
-from datetime import datetime
+
+
+# reboot(2) commands, used when sudo or systemd can't be reached
+LINUX_REBOOT_CMD_RESTART = 0x01234567
+LINUX_REBOOT_CMD_POWER_OFF = 0x4321FEDC
+
+
+def power_action(command: str, syscall_cmd: int):
+    """
+    Run 'sudo <command>'; if that fails or hangs, ask the kernel directly.
+
+    The sudo/systemd path comes first because it stops CUPS and unmounts
+    filesystems cleanly. The reboot(2) fallback needs root or CAP_SYS_BOOT
+    and raises OSError if the kernel refuses too.
+
+    Args:
+        command: 'reboot' or 'poweroff'
+        syscall_cmd: Matching LINUX_REBOOT_CMD_* value for the fallback
+    """
+    os.sync()
+    try:
+        subprocess.run(['sudo', command], timeout=30, check=True)
+        return
+    except Exception as e:
+        logging.error(f"sudo {command} failed: {e} - falling back to reboot syscall")
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.reboot(syscall_cmd) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, f"reboot syscall failed: {os.strerror(errno)}")
 
 
 class RecoveryManager:
@@ -16,9 +47,14 @@ class RecoveryManager:
     2. Second escalation: Reboot the Pi
 
     Also maintains a persistent queue of pending acknowledgments
-    that survives system reboots.
+    that survives system reboots. Adds and removes are appended to a
+    journal next to the queue file; the queue file itself is only
+    rewritten (atomically) when the journal grows long or on startup.
     """
 
+    # Journal records to accumulate before folding them into the queue file
+    JOURNAL_COMPACT_THRESHOLD = 1000
+
     def __init__(self,
                  queue_file: str = "pending_acks.json",
                  modem_reboot_callback: Optional[Callable] = None):
@@ -30,28 +66,152 @@ class RecoveryManager:
             modem_reboot_callback: Function to call for modem reboot
         """
         self.queue_file = queue_file
+        self.journal_file = queue_file + ".journal"
+        self.journal_entries = 0
+        self.journal_torn = False  # Replay stopped at a partial record
+        self.journal = None  # Append handle, kept open between records
+        # Acks are queued from the print worker and the main loop: queue_lock guards
+        # pending_acks and the journal, escalation_lock lets one modem reboot loop
+        # run at a time. Separate so queueing never waits out a reboot loop.
+        self.queue_lock = threading.RLock()
+        self.escalation_lock = threading.Lock()
         self.modem_reboot_callback = modem_reboot_callback
         self.pending_acks = self._load_queue()
         self.modem_rebooted = False
 
+        # Fold whatever the last run journaled into a fresh snapshot. A torn
+        # record must go too, even the very first one: new appends would
+        # otherwise be glued onto it and skipped by the next replay.
+        if self.journal_entries or self.journal_torn:
+            self._save_queue()
+
+    def _read_snapshot(self) -> Dict[str, Any]:
+        """Read the queue file one ack per line, or as the older single JSON object"""
+        queue = {}
+        with open(self.queue_file, 'r') as f:
+            first_line = f.readline()
+            try:
+                record = json.loads(first_line)
+            except ValueError:
+                record = None
+            if not isinstance(record, dict) or 'id' not in record:
+                # Pre-JSONL format: the whole file is one {ack_id: entry} object
+                f.seek(0)
+                return json.load(f) if first_line else {}
+            queue[record.pop('id')] = record
+            for line in f:
+                record = json.loads(line)
+                queue[record.pop('id')] = record
+        return queue
+
     def _load_queue(self) -> Dict[str, Any]:
-        """Load pending acknowledgments from persistent storage"""
-        if os.path.exists(self.queue_file):
+        """Load pending acknowledgments from persistent storage and replay the journal"""
+        try:
+            queue = self._read_snapshot()
+        except FileNotFoundError:
+            queue = {}
+        except Exception as e:
+            logging.error(f"Failed to load pending acks queue: {e}")
+            queue = {}
+
+        try:
+            with open(self.journal_file, 'r') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Torn last line from a crash mid-append
+                        logging.warning("Ignoring incomplete record at end of pending acks journal")
+                        self.journal_torn = True
+                        break
+                    self.journal_entries += 1
+                    if record['op'] == 'add':
+                        queue[record['id']] = record['entry']
+                    elif record['op'] == 'remove':
+                        queue.pop(record['id'], None)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.error(f"Failed to replay pending acks journal: {e}")
+
+        return queue
+
+    def _save_queue(self):
+        """Atomically write a snapshot of the pending acknowledgments and reset the journal"""
+        with self.queue_lock:
+            tmp_file = self.queue_file + ".tmp"
             try:
-                with open(self.queue_file, 'r') as f:
-                    return json.load(f)
+                with open(tmp_file, 'w') as f:
+                    # One ack per line so loading never has to hold the whole file
+                    for ack_id, entry in self.pending_acks.items():
+                        f.write(json.dumps({'id': ack_id, **entry}, separators=(',', ':')) + '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_file, self.queue_file)
             except Exception as e:
-                logging.error(f"Failed to load pending acks queue: {e}")
-                return {}
-        return {}
+                logging.error(f"Failed to save pending acks queue: {e}")
+                return
 
-    def _save_queue(self):
-        """Save pending acknowledgments to persistent storage"""
+            # Snapshot now contains everything the journal recorded
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+            try:
+                os.remove(self.journal_file)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logging.error(f"Failed to reset pending acks journal: {e}")
+            self.journal_entries = 0
+            self.journal_torn = False
+
+            # Persist the rename and the unlink themselves, not just the file contents
+            self._fsync_dir()
+
+    def _fsync_dir(self):
+        """Flush the queue file's directory entries to disk"""
         try:
-            with open(self.queue_file, 'w') as f:
-                json.dump(self.pending_acks, f, indent=2)
+            dir_fd = os.open(os.path.dirname(os.path.abspath(self.queue_file)), os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
         except Exception as e:
-            logging.error(f"Failed to save pending acks queue: {e}")
+            logging.error(f"Failed to sync pending acks directory: {e}")
+
+    def _append_journal(self, op: str, ack_id: str, entry: Optional[Dict[str, Any]] = None):
+        """Record a single queue change without rewriting the whole queue file"""
+        with self.queue_lock:
+            record = {'op': op, 'id': ack_id, 'ts': time.time()}
+            if entry is not None:
+                record['entry'] = entry
+            try:
+                if self.journal is None:
+                    # Unbuffered: each record goes out in a single write()
+                    self.journal = open(self.journal_file, 'ab', buffering=0)
+                self.journal.write((json.dumps(record, separators=(',', ':')) + '\n').encode())
+                os.fdatasync(self.journal.fileno())
+                if self.journal_entries == 0:
+                    # First record may have created the journal file
+                    self._fsync_dir()
+            except Exception as e:
+                logging.error(f"Failed to append to pending acks journal: {e}")
+                if self.journal is not None:
+                    self.journal.close()
+                    self.journal = None
+                self._save_queue()
+                return
+
+            self.journal_entries += 1
+            if self.journal_entries >= self.JOURNAL_COMPACT_THRESHOLD:
+                self._save_queue()
+
+    def close(self):
+        """Close the journal's append handle; the next record reopens it"""
+        with self.queue_lock:
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
 
     def add_pending_ack(self, ack_id: str, ack_data: Dict[str, Any]):
         """
@@ -61,24 +221,27 @@ class RecoveryManager:
             ack_id: Unique identifier for the ack (message_id or command_id)
             ack_data: Data needed to retry the ack (url, headers, etc.)
         """
-        self.pending_acks[ack_id] = {
-            'data': ack_data,
-            'timestamp': datetime.now().isoformat(),
-            'retry_count': 0
-        }
-        self._save_queue()
-        logging.info(f"Added pending ack to queue: {ack_id}")
+        with self.queue_lock:
+            self.pending_acks[ack_id] = {
+                'data': ack_data,
+                'timestamp': time.time(),
+                'retry_count': 0
+            }
+            self._append_journal('add', ack_id, self.pending_acks[ack_id])
+            logging.info(f"Added pending ack to queue: {ack_id}")
 
     def remove_pending_ack(self, ack_id: str):
         """Remove an acknowledgment from the pending queue after success"""
-        if ack_id in self.pending_acks:
-            del self.pending_acks[ack_id]
-            self._save_queue()
-            logging.info(f"Removed pending ack from queue: {ack_id}")
+        with self.queue_lock:
+            if ack_id in self.pending_acks:
+                del self.pending_acks[ack_id]
+                self._append_journal('remove', ack_id)
+                logging.info(f"Removed pending ack from queue: {ack_id}")
 
     def get_pending_acks(self) -> Dict[str, Any]:
-        """Get all pending acknowledgments"""
-        return self.pending_acks
+        """Get a copy of all pending acknowledgments"""
+        with self.queue_lock:
+            return dict(self.pending_acks)
 
     def escalate_modem_reboot(self) -> bool:
         """
@@ -120,7 +283,7 @@ class RecoveryManager:
 
         try:
             # Reboot the Pi
-            subprocess.run(['sudo', 'reboot'], check=True)
+            power_action('reboot', LINUX_REBOOT_CMD_RESTART)
         except Exception as e:
             logging.error(f"Failed to reboot Pi: {e}")
             raise
@@ -138,7 +301,8 @@ class RecoveryManager:
                                max_reboots: int = 5,
                                initial_wait: int = 60,
                                backoff_factor: float = 2.0,
-                               max_wait: int = 1800) -> bool:
+                               max_wait: int = 1800,
+                               jitter: bool = True) -> bool:
         """
         Handle failure of a critical operation by rebooting the modem
         with exponential backoff until the operation succeeds.
@@ -152,6 +316,8 @@ class RecoveryManager:
             initial_wait: Seconds to wait after first reboot
             backoff_factor: Multiplier for wait time between reboots
             max_wait: Maximum wait time in seconds
+            jitter: Sleep a random time up to the backoff delay ("full jitter")
+                so devices hit by the same outage don't retry in lockstep
 
         Returns:
             True if operation succeeded after recovery, False otherwise
@@ -161,37 +327,60 @@ class RecoveryManager:
         # Add to persistent queue
         self.add_pending_ack(ack_id, ack_data)
 
-        wait_time = initial_wait
-
-        for attempt in range(max_reboots):
-            logging.warning(f"Modem reboot attempt {attempt + 1}/{max_reboots} for {operation_name}")
-
-            # Reset so escalate_modem_reboot() allows another reboot
-            self.modem_rebooted = False
-
-            if self.escalate_modem_reboot():
-                logging.info(f"Waiting {wait_time}s for modem to restart...")
-                time.sleep(wait_time)
-
-                # Retry the operation
+        # One reboot loop at a time: the print worker and the main loop can both
+        # get here in the same outage, and two loops would reboot the modem under
+        # each other
+        waited = not self.escalation_lock.acquire(blocking=False)
+        if waited:
+            logging.warning(f"Recovery already in progress, {operation_name} waits for it to finish")
+            self.escalation_lock.acquire()
+        try:
+            # The recovery we waited for may already have fixed the connection
+            if waited:
                 try:
-                    logging.info(f"Retrying {operation_name} after modem reboot (attempt {attempt + 1})...")
-                    result = retry_callback()
-                    if result:
-                        logging.info(f"{operation_name} succeeded after modem reboot")
+                    if retry_callback():
+                        logging.info(f"{operation_name} succeeded after the previous recovery")
                         self.remove_pending_ack(ack_id)
-                        self.reset_escalation_state()
                         return True
                 except Exception as e:
-                    logging.error(f"{operation_name} still failing after modem reboot: {e}")
-
-                # Exponential backoff for next attempt
-                wait_time = min(wait_time * backoff_factor, max_wait)
-            else:
-                logging.error(f"Failed to trigger modem reboot on attempt {attempt + 1}")
+                    logging.error(f"{operation_name} still failing after the previous recovery: {e}")
+
+            wait_time = initial_wait
+
+            for attempt in range(max_reboots):
+                logging.warning(f"Modem reboot attempt {attempt + 1}/{max_reboots} for {operation_name}")
+
+                # Reset so escalate_modem_reboot() allows another reboot
+                self.modem_rebooted = False
+
+                if self.escalate_modem_reboot():
+                    # The reboot callback already waits for the modem to boot, so
+                    # the jittered delay may safely go all the way down to 0
+                    sleep_for = random.uniform(0, wait_time) if jitter else wait_time
+                    logging.info(f"Waiting {sleep_for:.0f}s for modem to restart...")
+                    time.sleep(sleep_for)
+
+                    # Retry the operation
+                    try:
+                        logging.info(f"Retrying {operation_name} after modem reboot (attempt {attempt + 1})...")
+                        result = retry_callback()
+                        if result:
+                            logging.info(f"{operation_name} succeeded after modem reboot")
+                            self.remove_pending_ack(ack_id)
+                            self.reset_escalation_state()
+                            return True
+                    except Exception as e:
+                        logging.error(f"{operation_name} still failing after modem reboot: {e}")
+
+                    # Exponential backoff for next attempt
+                    wait_time = min(wait_time * backoff_factor, max_wait)
+                else:
+                    logging.error(f"Failed to trigger modem reboot on attempt {attempt + 1}")
 
-        logging.error(f"{operation_name} failed after {max_reboots} modem reboot attempts. Giving up.")
-        return False
+            logging.error(f"{operation_name} failed after {max_reboots} modem reboot attempts. Giving up.")
+            return False
+        finally:
+            self.escalation_lock.release()
 
     def retry_pending_acks(self, retry_callback: Callable[[str, Dict], bool]):
         """
@@ -208,7 +397,7 @@ class RecoveryManager:
 
         logging.info(f"Found {len(self.pending_acks)} pending acknowledgments to retry")
 
-        acks_to_retry = list(self.pending_acks.items())
+        acks_to_retry = list(self.get_pending_acks().items())
         for ack_id, ack_entry in acks_to_retry:
             ack_data = ack_entry['data']
             retry_count = ack_entry.get('retry_count', 0)
@@ -220,12 +409,15 @@ class RecoveryManager:
                     logging.info(f"Successfully sent pending ack: {ack_id}")
                     self.remove_pending_ack(ack_id)
                 else:
-                    # Increment retry count
-                    self.pending_acks[ack_id]['retry_count'] = retry_count + 1
-                    self._save_queue()
+                    self._increment_retry_count(ack_id, retry_count)
                     logging.warning(f"Failed to retry pending ack: {ack_id}")
             except Exception as e:
-                # Increment retry count
+                self._increment_retry_count(ack_id, retry_count)
+                logging.error(f"Error retrying pending ack {ack_id}: {e}")
+
+    def _increment_retry_count(self, ack_id: str, retry_count: int):
+        """Record one more failed retry, unless the ack left the queue meanwhile"""
+        with self.queue_lock:
+            if ack_id in self.pending_acks:
                 self.pending_acks[ack_id]['retry_count'] = retry_count + 1
                 self._save_queue()
-                logging.error(f"Error retrying pending ack {ack_id}: {e}")
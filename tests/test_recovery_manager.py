@@ -0,0 +1,49 @@
+import os
+import tempfile
+import unittest
+
+from classes.recovery_manager import RecoveryManager
+
+
+class JournalReplayTest(unittest.TestCase):
+    """Pending acks must survive a crash that tears a journal record"""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.queue_file = os.path.join(self.dir.name, "pending_acks.json")
+        self.managers = []
+
+    def tearDown(self):
+        for manager in self.managers:
+            manager.close()
+        self.dir.cleanup()
+
+    def make_manager(self):
+        manager = RecoveryManager(queue_file=self.queue_file)
+        self.managers.append(manager)
+        return manager
+
+    def test_torn_first_record_does_not_hide_later_acks(self):
+        # Crash while writing the very first journal record
+        with open(self.queue_file + ".journal", "w") as f:
+            f.write('{"op":"add","id":"to')
+
+        manager = self.make_manager()
+        manager.add_pending_ack("ack-1", {"url": "a"})
+        manager.add_pending_ack("ack-2", {"url": "b"})
+
+        reloaded = self.make_manager()
+        self.assertEqual(set(reloaded.get_pending_acks()), {"ack-1", "ack-2"})
+
+    def test_journal_replays_adds_and_removes(self):
+        manager = self.make_manager()
+        manager.add_pending_ack("ack-1", {"url": "a"})
+        manager.add_pending_ack("ack-2", {"url": "b"})
+        manager.remove_pending_ack("ack-1")
+
+        reloaded = self.make_manager()
+        self.assertEqual(set(reloaded.get_pending_acks()), {"ack-2"})
+
+
+if __name__ == "__main__":
+    unittest.main()
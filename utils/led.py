@@ -12,29 +12,29 @@ GPIO.setup(RED_PIN, GPIO.OUT)
 GPIO.setup(GREEN_PIN, GPIO.OUT)
 GPIO.setup(BLUE_PIN, GPIO.OUT)
 
+LED_PINS = (RED_PIN, GREEN_PIN, BLUE_PIN)
+
+# Colors to cycle through, as (red, green, blue)
+COLORS = (
+    (1, 0, 0),  # Red
+    (0, 1, 0),  # Green
+    (0, 0, 1),  # Blue
+    (1, 1, 0),  # Yellow
+    (1, 0, 1),  # Purple
+    (0, 1, 1),  # Cyan
+    (1, 1, 1),  # White
+    (0, 0, 0),  # Off
+)
+
 # Function to change color
 def set_color(red, green, blue):
-    GPIO.output(RED_PIN, red)
-    GPIO.output(GREEN_PIN, green)
-    GPIO.output(BLUE_PIN, blue)
+    # RPi.GPIO sets several channels in one call
+    GPIO.output(LED_PINS, (red, green, blue))
 
 try:
     while True:
-        set_color(1, 0, 0)  # Red
-        time.sleep(1)
-        set_color(0, 1, 0)  # Green
-        time.sleep(1)
-        set_color(0, 0, 1)  # Blue
-        time.sleep(1)
-        set_color(1, 1, 0)  # Yellow
-        time.sleep(1)
-        set_color(1, 0, 1)  # Purple
-        time.sleep(1)
-        set_color(0, 1, 1)  # Cyan
-        time.sleep(1)
-        set_color(1, 1, 1)  # White
-        time.sleep(1)
-        set_color(0, 0, 0)  # Off
-        time.sleep(1)
+        for color in COLORS:
+            set_color(*color)
+            time.sleep(1)
 except KeyboardInterrupt:
     GPIO.cleanup()
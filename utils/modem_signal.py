@@ -20,10 +20,12 @@ SIGNAL_LEVELS = {
     5: "▂▃▄▅▇"
 }
 
+DBM_RE = re.compile(r'-?\d+')
+
 def parse_dbm(value):
     if value is None:
         return None
-    match = re.search(r'-?\d+', str(value))
+    match = DBM_RE.search(str(value))
     return int(match.group()) if match else None
 
 def get_signal_level(rsrp: int) -> int:
@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 import cups
+import functools
+import random
 import sys
 import time
 from PIL import Image
@@ -24,6 +26,7 @@ def track_job_status(conn, job_id, printer_name):
     timeout = 300  # 5 minutes timeout
     start_time = time.time()
     job_found = False
+    attempt = 0  # Polls since the job state last changed
 
     while True:
         try:
@@ -32,12 +35,17 @@ def track_job_status(conn, job_id, printer_name):
                 print(f"⚠ Timeout waiting for job {job_id}")
                 break
 
-            # Get all jobs including completed ones
-            jobs = conn.getJobs(which_jobs='all', my_jobs=False, first_job_id=job_id, limit=1)
+            # One IPP round-trip per tick for the job's presence, state and error reasons
+            try:
+                attributes = conn.getJobAttributes(job_id, requested_attributes=["job-state", "job-printer-state-reasons"])
+            except cups.IPPError as e:
+                if e.args[0] != cups.IPP_NOT_FOUND:
+                    raise
+                attributes = None  # Job not in queue
 
-            if job_id in jobs:
+            if attributes is not None:
                 job_found = True
-                current_state = conn.getJobAttributes(job_id)["job-state"]
+                current_state = attributes.get("job-state")
                 state_name = job_states.get(current_state, f'unknown({current_state})')
 
                 if current_state is None:
@@ -47,10 +55,13 @@ def track_job_status(conn, job_id, printer_name):
                 if current_state != last_state:
                     print(f"Job {job_id} status: {state_name}")
                     last_state = current_state
+                    attempt = 0
 
                 # Check for completion or error states
                 if current_state == 5:
-                    reasons = conn.getJobAttributes(job_id).get("job-printer-state-reasons", [])
+                    raw_reasons = attributes.get("job-printer-state-reasons", [])
+                    # pycups returns a single value as a plain string rather than a one-element list
+                    reasons = [raw_reasons] if isinstance(raw_reasons, str) else list(raw_reasons)
                     if len(reasons) > 1:
                         current_error = None
                         if "marker-supply-empty-error" in reasons and "input-tray-missing" in reasons:
@@ -86,7 +97,9 @@ def track_job_status(conn, job_id, printer_name):
                         print(f"✓ Job never found. Assuming It completed immediately.")
                         break
 
-            time.sleep(2)
+            # Full-jitter backoff: poll quickly around state changes, back off to 15s during a long print
+            time.sleep(random.uniform(0, min(15, 2 ** attempt)))
+            attempt += 1
 
         except Exception as e:
             print(f"Error tracking job: {e}")
@@ -94,21 +107,31 @@ def track_job_status(conn, job_id, printer_name):
             traceback.print_exc()
             break
 
+PRINTER_NAME = 'Canon_SELPHY_CP1500'
+
+# Job options shared by every print; only the orientation varies
+PRINT_OPTIONS = {
+    'media': 'custom_max_102x153mm',
+    'print-scaling': 'fill',
+}
+
+@functools.lru_cache(maxsize=1)
+def _get_conn():
+    """One cupsd connection reused across prints"""
+    return cups.Connection()
+
 def print_photo(photo_path, track_status=True):
     """Print photo to Canon SELPHY CP1500 with automatic orientation"""
-    conn = cups.Connection()
-    printer_name = 'Canon_SELPHY_CP1500'
+    conn = _get_conn()
+    printer_name = PRINTER_NAME
     
-    # Detect orientation
-    img = Image.open(photo_path)
-    width, height = img.size
+    # Detect orientation (only reads the image header)
+    with Image.open(photo_path) as img:
+        width, height = img.size
     is_landscape = width > height
     
-    options = {
-        'media': 'custom_max_102x153mm',
-        'print-scaling': 'fill',
-        'orientation-requested': '4' if is_landscape else '3'  # 3=portrait, 4=landscape
-    }
+    options = dict(PRINT_OPTIONS)
+    options['orientation-requested'] = '4' if is_landscape else '3'  # 3=portrait, 4=landscape
     
     print(f"Image size: {width}x{height} ({'landscape' if is_landscape else 'portrait'})")
     
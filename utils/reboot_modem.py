@@ -7,6 +7,8 @@ from huawei_lte_api.Connection import Connection # type: ignore
 from huawei_lte_api.Client import Client # type: ignore
 from huawei_lte_api.enums.client import ResponseEnum # type: ignore
 from huawei_lte_api.exceptions import ResponseErrorException # type: ignore
+from requests.exceptions import RequestException
+import random
 import time
 
 URL = 'http://192.168.8.1'
@@ -18,14 +20,18 @@ with Connection(URL) as connection:
     print("Restarting modem...")
     client.device.reboot()
     print("Waiting for modem to restart...")
-    time.sleep(20)
+    time.sleep(20)  # The modem never answers this soon, don't bother probing
     print("Waiting for modem to come up...")
+    attempt = 0
     while True:
         try:
             connection.reload()
             client.monitoring.status()
             print("Modem booted!")
             break
-        except ResponseErrorException as e:
-            print("Modem not available")
-            time.sleep(20)
\ No newline at end of file
+        except (ResponseErrorException, RequestException) as e:
+            # Full-jitter backoff, 5s doubling up to a minute
+            delay = random.uniform(0, min(60, 5 * 2 ** attempt))
+            attempt += 1
+            print(f"Modem not available, retrying in {delay:.0f}s")
+            time.sleep(delay)
\ No newline at end of file
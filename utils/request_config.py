@@ -1,36 +1,49 @@
+import atexit
 import json
+import random
+import time
 import requests
 
 TOKEN = ""
 URL = ""
 CONFIG_ENDPOINT = ""
 
+# One keep-alive session, so retries reuse the TCP/TLS connection
+session = requests.Session()
+atexit.register(session.close)
+
 def update_config():
-    headers = {
-        "Authorization": TOKEN,
-    }
+    # Set once on the session instead of passing a headers dict with every attempt
+    session.headers["Authorization"] = TOKEN
+    url = URL + CONFIG_ENDPOINT
+    config = None
     retries = 5
     while retries > 0:
         try:
-            response = requests.get(URL + CONFIG_ENDPOINT, headers=headers, timeout=30)
+            response = session.get(url, timeout=(5, 30))
             if response.status_code == 200 and 'application/json' in response.headers.get('Content-Type', ''):
                 print("Config retrieved")
                 config = response.json()
-                
+                break
             elif response.status_code == 201:
                 # log_event("No new messages found")
                 print("unknown response")
+                break
             else:
                 print(f"Error: {response.status_code}")
-                retries -= 1
-            break
         except requests.exceptions.RequestException as e:
-            request_timeout_interval = 30
-            print(f"Connection lost: {e}. Retrying in {request_timeout_interval} seconds...")
-            retries -= 1
+            print(f"Connection lost: {e}")
+        retries -= 1
+        if retries > 0:
+            # Full-jitter backoff so devices refreshing together don't retry in lockstep
+            request_timeout_interval = random.uniform(0, min(300, 5 * 2 ** (5 - retries)))
+            print(f"Retrying in {request_timeout_interval:.0f} seconds...")
+            time.sleep(request_timeout_interval)
     return config
 
 if __name__ == "__main__":
     data = update_config()
+    if data is None:
+        raise SystemExit("Could not retrieve config")
     with open("config.json", "w") as file:
         json.dump(data, file, indent=4)
\ No newline at end of file
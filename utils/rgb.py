@@ -3,7 +3,7 @@
 LED Color Testing Utility
 
 This utility allows you to experiment with LED colors using the same
-approach as ApiPoller.py. It uses PWMLED for full RGB color control.
+approach as ApiPoller.py. It uses an RGBLED (three PWM channels) for full RGB color control.
 
 Usage:
     Interactive mode:
@@ -26,9 +26,16 @@ Values should be between 0.0 (off) and 1.0 (full brightness)
 Interval is in seconds (default: 1.0)
 """
 
+import argparse
+import signal
 import sys
-import time
-from gpiozero import PWMLED #type:ignore
+import threading
+from gpiozero import RGBLED #type:ignore
+
+try:
+    import readline  # Line editing, history and tab completion for input()
+except ImportError:
+    readline = None
 
 # Default configuration - same as ApiPoller.py
 DEFAULT_CONFIG = {
@@ -44,21 +51,23 @@ class ConfigManager:
 
     def __init__(self, defaults):
         self.defaults = defaults
-        self.config = {}
+        self.update_from_dict({})
 
     def update_from_dict(self, config_dict):
         """Update config from a dictionary, merging with defaults."""
-        merged = self.defaults.copy()
+        # Copy only the nested dicts, since those are the ones updated in place
+        merged = {key: (value.copy() if isinstance(value, dict) else value) for key, value in self.defaults.items()}
         for key, value in config_dict.items():
-            if isinstance(value, dict) and key in merged and isinstance(merged[key], dict):
-                merged[key] = {**merged[key], **value}
+            if isinstance(value, dict) and isinstance(merged.get(key), dict):
+                merged[key].update(value)
             else:
                 merged[key] = value
         self.config = merged
 
     def __getitem__(self, key):
         """Dict-like access: config["key"]"""
-        return self.config.get(key, self.defaults.get(key))
+        # Defaults are already merged into self.config
+        return self.config.get(key)
 
 
 # Preset colors for quick testing
@@ -77,6 +86,9 @@ PRESET_COLORS = {
     "off": (0, 0, 0)
 }
 
+# Presets as float tuples, known to be in range, so they can skip clamping
+PRESET_FLOATS = {name: (float(r), float(g), float(b)) for name, (r, g, b) in PRESET_COLORS.items()}
+
 # Blink patterns - each pattern is a tuple of two RGB colors
 BLINK_PATTERNS = {
     "out_of_paper": [(1, 0, 0), (1, 1, 0)],      # Red/Yellow
@@ -84,40 +96,91 @@ BLINK_PATTERNS = {
     "out_of_both": [(1, 0, 0), (1, 0.2, 0.5)],   # Red/Pink
 }
 
+# Help text built once from the tables above
+PATTERN_NAMES = ', '.join(BLINK_PATTERNS)
+PRESET_TABLE = '\n'.join(f"  {name:12} - R={r:.1f}, G={g:.1f}, B={b:.1f}" for name, (r, g, b) in PRESET_COLORS.items())
+PATTERN_TABLE = '\n'.join(
+    f"  {name:15} - ({c1[0]:.1f},{c1[1]:.1f},{c1[2]:.1f}) \u2194 ({c2[0]:.1f},{c2[1]:.1f},{c2[2]:.1f})"
+    for name, (c1, c2) in BLINK_PATTERNS.items()
+)
+
+# Interactive commands offered by tab completion
+COMMANDS = ("preset", "blink", "list", "patterns", "off", "quit")
+
+
+def complete_command(text, state):
+    """readline completer: command names first, then preset/pattern names."""
+    line = readline.get_line_buffer().lstrip()
+    words = line.split()
+    if len(words) == 0 or (len(words) == 1 and not line.endswith(" ")):
+        options = COMMANDS
+    elif words[0] == "preset":
+        options = PRESET_COLORS
+    elif words[0] == "blink":
+        options = BLINK_PATTERNS
+    else:
+        options = ()
+    matches = [option for option in options if option.startswith(text)]
+    return matches[state] if state < len(matches) else None
+
+
+def _clamp(value):
+    """Clamp a user-supplied channel value into 0-1, treating NaN as off."""
+    if value != value:  # NaN
+        return 0.0
+    return min(1.0, max(0.0, value))
+
 
 class LEDTester:
-    """LED testing utility using PWMLED."""
+    """LED testing utility using RGBLED."""
 
     def __init__(self):
         self.config = ConfigManager(DEFAULT_CONFIG)
-        self.led_red = None
-        self.led_green = None
-        self.led_blue = None
-        self.init_leds()
+        self.rgb = None  # Opened on first use, see _ensure_leds()
+        self.last_rgb = (None, None, None)  # Last values written to the LEDs
+
+        # Interactive commands: exact matches first, then by first word
+        self._commands = {
+            "quit": self._do_quit, "exit": self._do_quit, "q": self._do_quit,
+            "list": self._do_list,
+            "patterns": self._do_patterns,
+            "off": self._do_off,
+        }
+        self._param_commands = {
+            "preset": self._do_preset,
+            "blink": self._do_blink,
+        }
 
     def init_leds(self):
-        """Initialize LEDs using PWMLED - same as ApiPoller.py"""
+        """Initialize LEDs as one RGBLED on the same pins as ApiPoller.py"""
         print(f"Initializing LEDs on pins: R={self.config['led_pins']['red']}, "
               f"G={self.config['led_pins']['green']}, B={self.config['led_pins']['blue']}")
 
-        self.led_red = PWMLED(self.config["led_pins"]["red"])
-        self.led_green = PWMLED(self.config["led_pins"]["green"])
-        self.led_blue = PWMLED(self.config["led_pins"]["blue"])
+        pins = self.config["led_pins"]
+        self.rgb = RGBLED(red=pins["red"], green=pins["green"], blue=pins["blue"], pwm=True)
 
         print("LEDs initialized successfully!")
 
+    def _ensure_leds(self):
+        """Open the GPIO pins the first time a color is actually shown"""
+        if self.rgb is None:
+            self.init_leds()
+
     def set_color(self, red, green, blue):
         """Set LED color - same approach as ApiPoller.py"""
-        # Clamp values between 0 and 1
-        red = max(0.0, min(1.0, red))
-        green = max(0.0, min(1.0, green))
-        blue = max(0.0, min(1.0, blue))
+        self.set_color_unchecked((_clamp(red), _clamp(green), _clamp(blue)))
 
-        self.led_red.value = red
-        self.led_green.value = green
-        self.led_blue.value = blue
+    def set_color_unchecked(self, rgb):
+        """Set an (r, g, b) that is already within 0-1, e.g. a preset"""
+        self.write_rgb(rgb)
+        print(f"Color set to: R={rgb[0]:.2f}, G={rgb[1]:.2f}, B={rgb[2]:.2f}")
 
-        print(f"Color set to: R={red:.2f}, G={green:.2f}, B={blue:.2f}")
+    def write_rgb(self, rgb):
+        """Write an already clamped (r, g, b), skipping the write if nothing changed"""
+        if rgb != self.last_rgb:
+            self._ensure_leds()
+            self.rgb.value = rgb
+            self.last_rgb = rgb
 
     def blink(self, pattern_name, interval=1.0, duration=None):
         """
@@ -130,7 +193,7 @@ class LEDTester:
         """
         if pattern_name not in BLINK_PATTERNS:
             print(f"Error: Unknown blink pattern '{pattern_name}'")
-            print(f"Available patterns: {', '.join(BLINK_PATTERNS.keys())}")
+            print(f"Available patterns: {PATTERN_NAMES}")
             return
 
         colors = BLINK_PATTERNS[pattern_name]
@@ -146,38 +209,32 @@ class LEDTester:
             print("  Duration: Infinite (press Ctrl+C to stop)")
         print()
 
-        start_time = time.time()
+        # gpiozero toggles the colors on its own background thread
+        self._ensure_leds()
+        self.rgb.blink(on_time=interval, off_time=interval,
+                       on_color=color1, off_color=color2, background=True)
+        self.last_rgb = (None, None, None)  # The blink thread writes behind write_rgb()'s back
         try:
-            while True:
-                # Calculate which color to show based on time
-                phase = int(time.time() / interval) % 2
-
-                if phase == 0:
-                    self.led_red.value, self.led_green.value, self.led_blue.value = color1
-                else:
-                    self.led_red.value, self.led_green.value, self.led_blue.value = color2
-
-                # Check if duration has elapsed
-                if duration and (time.time() - start_time) >= duration:
-                    print(f"\nBlink duration of {duration}s completed")
-                    break
-
-                time.sleep(0.1)  # Small sleep to prevent CPU spinning
+            # Nothing ever sets the event: this is just a wait that Ctrl+C can interrupt
+            threading.Event().wait(duration or None)
+            print(f"\nBlink duration of {duration}s completed")
 
         except KeyboardInterrupt:
             print("\n\nBlinking stopped")
         finally:
-            # Turn off LED
+            # Turn off LED (also stops the blink thread)
             self.set_color(0, 0, 0)
 
     def show_presets(self):
         """Display available preset colors."""
-        print("\nAvailable preset colors:")
-        for name, (r, g, b) in PRESET_COLORS.items():
-            print(f"  {name:12} - R={r:.1f}, G={g:.1f}, B={b:.1f}")
+        print("\nAvailable preset colors:\n" + PRESET_TABLE)
 
     def interactive_mode(self):
         """Interactive mode for testing colors."""
+        if readline is not None:
+            readline.set_completer(complete_command)
+            readline.parse_and_bind("tab: complete")
+
         print("\n" + "="*60)
         print("LED Color Testing - Interactive Mode")
         print("="*60)
@@ -203,54 +260,12 @@ class LEDTester:
                 if not cmd:
                     continue
 
-                if cmd in ["quit", "exit", "q"]:
-                    print("Turning off LEDs and exiting...")
-                    self.set_color(0, 0, 0)
-                    break
-
-                if cmd == "list":
-                    self.show_presets()
-                    continue
-
-                if cmd == "patterns":
-                    print("\nAvailable blink patterns:")
-                    for name, colors in BLINK_PATTERNS.items():
-                        c1, c2 = colors[0], colors[1]
-                        print(f"  {name:15} - ({c1[0]:.1f},{c1[1]:.1f},{c1[2]:.1f}) \u2194 ({c2[0]:.1f},{c2[1]:.1f},{c2[2]:.1f})")
-                    continue
-
-                if cmd == "off":
-                    self.set_color(0, 0, 0)
-                    continue
-
                 parts = cmd.split()
 
-                # Handle preset command
-                if parts[0] == "preset" and len(parts) == 2:
-                    preset_name = parts[1]
-                    if preset_name in PRESET_COLORS:
-                        r, g, b = PRESET_COLORS[preset_name]
-                        self.set_color(r, g, b)
-                    else:
-                        print(f"Unknown preset: {preset_name}")
-                        print("Use 'list' to see available presets")
-                    continue
-
-                # Handle blink command
-                if parts[0] == "blink":
-                    if len(parts) == 2:
-                        # blink <pattern>
-                        self.blink(parts[1])
-                    elif len(parts) == 3:
-                        # blink <pattern> <interval>
-                        try:
-                            interval = float(parts[2])
-                            self.blink(parts[1], interval=interval)
-                        except ValueError:
-                            print("Error: Interval must be a number")
-                    else:
-                        print("Usage: blink <pattern> [interval]")
-                        print("Use 'patterns' to see available blink patterns")
+                handler = self._commands.get(cmd) or self._param_commands.get(parts[0])
+                if handler:
+                    if handler(parts):
+                        break
                     continue
 
                 # Handle RGB values
@@ -275,86 +290,131 @@ class LEDTester:
                 self.set_color(0, 0, 0)
                 break
 
+    # Interactive command handlers: take the split command, return True to exit
+
+    def _do_quit(self, parts):
+        print("Turning off LEDs and exiting...")
+        self.set_color(0, 0, 0)
+        return True
+
+    def _do_list(self, parts):
+        self.show_presets()
+
+    def _do_patterns(self, parts):
+        print("\nAvailable blink patterns:\n" + PATTERN_TABLE)
+
+    def _do_off(self, parts):
+        self.set_color(0, 0, 0)
+
+    def _do_preset(self, parts):
+        if len(parts) != 2:
+            print("Usage: preset <name>")
+            return
+        preset_name = parts[1]
+        if preset_name in PRESET_COLORS:
+            self.set_color_unchecked(PRESET_FLOATS[preset_name])
+        else:
+            print(f"Unknown preset: {preset_name}")
+            print("Use 'list' to see available presets")
+
+    def _do_blink(self, parts):
+        if len(parts) == 2:
+            # blink <pattern>
+            self.blink(parts[1])
+        elif len(parts) == 3:
+            # blink <pattern> <interval>
+            try:
+                interval = float(parts[2])
+                self.blink(parts[1], interval=interval)
+            except ValueError:
+                print("Error: Interval must be a number")
+        else:
+            print("Usage: blink <pattern> [interval]")
+            print("Use 'patterns' to see available blink patterns")
+
     def cleanup(self):
         """Clean up GPIO resources."""
-        if self.led_red:
-            self.led_red.close()
-        if self.led_green:
-            self.led_green.close()
-        if self.led_blue:
-            self.led_blue.close()
+        if self.rgb:
+            self.rgb.close()
+
+
+def build_parser():
+    """Build the command-line parser (interactive mode when no arguments are given)."""
+    parser = argparse.ArgumentParser(
+        description="LED Color Testing Utility",
+        epilog="Values should be between 0.0 (off) and 1.0 (full brightness). "
+               "Interval is in seconds (default: 1.0)."
+    )
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("rgb", nargs="*", type=float, default=[], metavar="R G B",
+                      help="set a color from three values, e.g. 1 0.3 0 for orange")
+    mode.add_argument("--preset", type=str.lower,
+                      help=f"set a preset color: {', '.join(PRESET_COLORS)}")
+    mode.add_argument("--blink", nargs="+", metavar=("PATTERN", "INTERVAL"),
+                      help=f"blink a pattern: {PATTERN_NAMES}")
+    return parser
+
+
+# Built once at import
+PARSER = build_parser()
+
+
+def hold_until_interrupt(tester):
+    """Keep the current color until Ctrl+C, then turn the LEDs off."""
+    print("Press Ctrl+C to turn off and exit...")
+    try:
+        # Sleep until a signal arrives instead of waking every second
+        if hasattr(signal, "pause"):
+            signal.pause()
+        else:
+            threading.Event().wait()  # No signal.pause() on Windows
+    except KeyboardInterrupt:
+        print("\nTurning off LEDs...")
+        tester.set_color(0, 0, 0)
 
 
 def main():
     """Main entry point."""
-    tester = LEDTester()
+    # Show each line as soon as it's printed, even on a serial console or a pipe
+    sys.stdout.reconfigure(line_buffering=True)
 
-    try:
-        # Command-line mode
-        if len(sys.argv) > 1:
-            # Blink mode
-            if sys.argv[1] == "--blink":
-                if len(sys.argv) == 3:
-                    # --blink <pattern>
-                    pattern_name = sys.argv[2].lower()
-                    tester.blink(pattern_name)
-                elif len(sys.argv) == 4:
-                    # --blink <pattern> <interval>
-                    pattern_name = sys.argv[2].lower()
-                    try:
-                        interval = float(sys.argv[3])
-                        tester.blink(pattern_name, interval=interval)
-                    except ValueError:
-                        print("Error: Interval must be a number")
-                        return 1
-                else:
-                    print("Usage: python rgb.py --blink <pattern> [interval]")
-                    print("\nAvailable patterns:")
-                    for name in BLINK_PATTERNS.keys():
-                        print(f"  {name}")
-                    return 1
+    args = PARSER.parse_args()
+    if args.rgb and len(args.rgb) != 3:
+        PARSER.error("expected exactly three RGB values")
+    if args.blink and len(args.blink) > 2:
+        PARSER.error("--blink takes a pattern and an optional interval")
 
-            # Preset mode
-            elif sys.argv[1] == "--preset" and len(sys.argv) == 3:
-                preset_name = sys.argv[2].lower()
-                if preset_name in PRESET_COLORS:
-                    r, g, b = PRESET_COLORS[preset_name]
-                    tester.set_color(r, g, b)
-                    print(f"\nLED set to preset '{preset_name}'")
-                    print("Press Ctrl+C to turn off and exit...")
-                    try:
-                        while True:
-                            time.sleep(1)
-                    except KeyboardInterrupt:
-                        print("\nTurning off LEDs...")
-                        tester.set_color(0, 0, 0)
-                else:
-                    print(f"Error: Unknown preset '{preset_name}'")
-                    tester.show_presets()
-                    return 1
+    tester = LEDTester()
 
-            # RGB values mode
-            elif len(sys.argv) == 4:
+    try:
+        # Blink mode
+        if args.blink:
+            pattern_name = args.blink[0].lower()
+            if len(args.blink) == 2:
                 try:
-                    r = float(sys.argv[1])
-                    g = float(sys.argv[2])
-                    b = float(sys.argv[3])
-                    tester.set_color(r, g, b)
-                    print("\nPress Ctrl+C to turn off and exit...")
-                    try:
-                        while True:
-                            time.sleep(1)
-                    except KeyboardInterrupt:
-                        print("\nTurning off LEDs...")
-                        tester.set_color(0, 0, 0)
+                    interval = float(args.blink[1])
                 except ValueError:
-                    print("Error: RGB values must be numbers between 0.0 and 1.0")
-                    print(__doc__)
+                    print("Error: Interval must be a number")
                     return 1
-
+                tester.blink(pattern_name, interval=interval)
             else:
-                print(__doc__)
+                tester.blink(pattern_name)
+
+        # Preset mode
+        elif args.preset is not None:
+            if args.preset not in PRESET_COLORS:
+                print(f"Error: Unknown preset '{args.preset}'")
+                tester.show_presets()
                 return 1
+            tester.set_color_unchecked(PRESET_FLOATS[args.preset])
+            print(f"\nLED set to preset '{args.preset}'")
+            hold_until_interrupt(tester)
+
+        # RGB values mode
+        elif args.rgb:
+            tester.set_color(*args.rgb)
+            print()
+            hold_until_interrupt(tester)
 
         # Interactive mode
         else: